@@ -1,4 +1,11 @@
+import asyncio
 from typing import List
+from lib.agents.loop_detector import STOP_ACTION
+from lib.utils.checkpoint import current_checkpointer
+from lib.utils.recording import record
+from lib.utils.trajectory_log import TrajectoryWriter, current_trajectory_writer
+from lib.utils.tracing import span, traced
+from lib.utils.usage import BudgetExceeded, UsageMeter, task_budget, use_usage
 
 
 class Agent:
@@ -17,18 +24,65 @@ class Agent:
         self.max_actions = max_actions
         self.verbose = verbose
         self.logging = logging
-        self.trajectory = []
-        self.data_to_log = {}
+        self.trajectory_writer = None
+        # Optional LoopDetector, see guard_loop
+        self.loop_detector = None
+        self.loop_fingerprints = []
+        self.loop_hinted = False
+        # LM usage of the task, with optional token and cost budgets
+        self.usage = UsageMeter(name="task", **task_budget())
+        self.budget_exceeded = False
 
     def reset(self):
         self.previous_actions = []
         self.previous_reasons = []
         self.previous_responses = []
-        self.trajectory = []
-        self.data_to_log = {}
+        self.trajectory_writer = None
+        self.loop_fingerprints = []
+        self.loop_hinted = False
+        if self.loop_detector is not None:
+            self.loop_detector.reset()
+        self.usage.reset()
+        self.budget_exceeded = False
+
+    def checkpoint_state(self):
+        """
+        What restore_state needs to continue the task from the current step.
+        """
+        return {
+            "previous_actions": list(self.previous_actions),
+            "previous_reasons": list(self.previous_reasons),
+            "previous_responses": list(self.previous_responses),
+            "loop_fingerprints": list(self.loop_fingerprints),
+            "loop_hinted": self.loop_hinted,
+            "loop_detector": (
+                self.loop_detector.state() if self.loop_detector is not None else None
+            ),
+            "usage": self.usage.state(),
+            "budget_exceeded": self.budget_exceeded,
+        }
+
+    def restore_state(self, state):
+        self.previous_actions = list(state["previous_actions"])
+        self.previous_reasons = list(state["previous_reasons"])
+        self.previous_responses = list(state["previous_responses"])
+        self.loop_fingerprints = list(state["loop_fingerprints"])
+        self.loop_hinted = state["loop_hinted"]
+        if self.loop_detector is not None and state["loop_detector"] is not None:
+            self.loop_detector.load_state(state["loop_detector"])
+        self.usage.load_state(state["usage"])
+        self.budget_exceeded = state["budget_exceeded"]
+
+    def save_checkpoint(self, env):
+        checkpointer = current_checkpointer()
+        if checkpointer is not None and not env.done():
+            with span("checkpoint"):
+                checkpointer.save(self, env)
 
     def get_trajectory(self):
-        return self.trajectory
+        if self.trajectory_writer is None:
+            return []
+        return self.trajectory_writer.view()
 
     def update_history(self, action, reason):
         if action:
@@ -39,16 +93,128 @@ class Agent:
     def predict_action(self, objective, observation, url=None):
         pass
 
+    def guard_loop(self, objective, observation, url, action, reason):
+        """
+        Checks the predicted action against the loop detector, treating the
+        whole task as one frame. With the "hint" policy the LM is told and asked
+        once more, otherwise or if it keeps looping the task is stopped.
+        """
+        if self.loop_detector is None or reason == "budget":
+            return action, reason
+        detector = self.loop_detector
+        loop = detector.check(self.loop_fingerprints, url, observation, action)
+        if loop is None:
+            return action, reason
+        record("loop", loop=loop, action=action, policy=detector.policy)
+        detector.detected(observation)
+        if detector.policy == "hint" and not self.loop_hinted:
+            self.loop_hinted = True
+            self.receive_response(detector.hint(loop))
+            try:
+                action, reason = self.predict_action(
+                    objective=objective, observation=observation, url=url
+                )  # type: ignore
+            except BudgetExceeded as e:
+                return self.budget_stop(e)
+            if detector.check(self.loop_fingerprints, url, observation, action) is None:
+                return action, reason
+        detector.stopped(observation)
+        return STOP_ACTION, "loop"
+
+    def observation_query(self, objective):
+        # Text the observation is ranked against when pruning is enabled
+        return objective
+
+    async def apredict_action(self, objective, observation, url=None):
+        # LM calls are blocking, run them off the event loop so that other
+        # tasks can make progress while this one waits on the LM.
+        return await asyncio.to_thread(
+            self.predict_action, objective=objective, observation=observation, url=url
+        )
+
     def receive_response(self, response):
         self.previous_responses += [response]
 
+    def budget_stop(self, error):
+        # Ends the task through the environment so that it is still evaluated
+        print(f"Ending task: {error}")
+        self.budget_exceeded = True
+        return STOP_ACTION, "budget"
+
+    def act_status(self, status):
+        """
+        Adds the agent's own counters to the final environment status.
+        """
+        status = {
+            **status,
+            **self.usage.summary(),
+            "budget_exceeded": self.budget_exceeded or self.usage.exceeded,
+        }
+        if self.loop_detector is not None:
+            status.update(self.loop_detector.stats())
+        return status
+
+    @traced("act")
     def act(self, objective, env):
+        with use_usage(self.usage):
+            return self.act_status(self._act(objective, env))
+
+    def _act(self, objective, env):
+        record("task", objective=objective)
         while not env.done():
-            observation = env.observation()
-            action, reason = self.predict_action(
-                objective=objective, observation=observation, url=env.get_url()
-            )  # type: ignore
+            observation = env.observation(query=self.observation_query(objective))
+            record("observation", url=env.get_url(), observation=observation)
+            try:
+                action, reason = self.predict_action(
+                    objective=objective, observation=observation, url=env.get_url()
+                )  # type: ignore
+            except BudgetExceeded as e:
+                action, reason = self.budget_stop(e)
+            action, reason = self.guard_loop(
+                objective, observation, env.get_url(), action, reason
+            )
             status = env.step(action)
+            record("step", action=action, status=status)
+
+            if self.logging:
+                self.log_step(
+                    objective=objective,
+                    url=env.get_url(),
+                    observation=observation,
+                    action=action,
+                    reason=reason,
+                    status=status,
+                )
+            self.save_checkpoint(env)
+
+            if len(self.previous_actions) >= self.max_actions:
+                print(f"Agent exceeded max actions: {self.max_actions}")
+                break
+
+        return status
+
+    async def aact(self, objective, env):
+        with span("act"), use_usage(self.usage):
+            return self.act_status(await self._aact(objective, env))
+
+    async def _aact(self, objective, env):
+        record("task", objective=objective)
+        while not env.done():
+            observation = await env.aobservation(
+                query=self.observation_query(objective)
+            )
+            record("observation", url=env.get_url(), observation=observation)
+            try:
+                action, reason = await self.apredict_action(
+                    objective=objective, observation=observation, url=env.get_url()
+                )  # type: ignore
+            except BudgetExceeded as e:
+                action, reason = self.budget_stop(e)
+            action, reason = self.guard_loop(
+                objective, observation, env.get_url(), action, reason
+            )
+            status = await env.astep(action)
+            record("step", action=action, status=status)
 
             if self.logging:
                 self.log_step(
@@ -67,15 +233,23 @@ class Agent:
         return status
 
     def log_step(self, objective, url, observation, action, reason, status):
-        self.data_to_log["objective"] = objective
-        self.data_to_log["url"] = url
-        self.data_to_log["observation"] = observation
-        self.data_to_log["previous_actions"] = self.previous_actions[:-1]
-        self.data_to_log["previous_responses"] = self.previous_responses[:-1]
-        self.data_to_log["previous_reasons"] = self.previous_reasons[:-1]
-        self.data_to_log["action"] = action
-        self.data_to_log["reason"] = reason
-        for k, v in status.items():
-            self.data_to_log[k] = v
-        self.trajectory.append(self.data_to_log)
-        self.data_to_log = {}
+        if self.trajectory_writer is None:
+            # Streams to the task's trajectory file when one is set up,
+            # otherwise the steps are kept in memory
+            self.trajectory_writer = current_trajectory_writer() or TrajectoryWriter()
+        history = {
+            "previous_actions": self.previous_actions,
+            "previous_responses": self.previous_responses,
+            "previous_reasons": self.previous_reasons,
+        }
+        self.trajectory_writer.write_step(
+            objective=objective,
+            url=url,
+            observation=observation,
+            history={
+                key: (items, max(len(items) - 1, 0)) for key, items in history.items()
+            },
+            action=action,
+            reason=reason,
+            **status,
+        )
@@ -1,5 +1,9 @@
 from lib.agents.agent import Agent
-from lib.modules.dspy_modules import *
+from lib.agents.history import ActionHistory
+from lib.modules.lm_registry import get_lm
+from lib.utils.recording import recording_lm
+from lib.utils.tracing import traced
+from lib.utils.usage import metered_lm
 from typing import List
 import dspy
 
@@ -15,6 +19,9 @@ class PromptAgent(Agent):
         previous_reasons: List = [],
         previous_responses: List = [],
         debug: bool = False,
+        lm=None,
+        history_max_tokens: int = 1000,
+        inspect_history: bool = False,
     ):
         super().__init__(
             max_actions=max_actions,
@@ -25,43 +32,68 @@ class PromptAgent(Agent):
             previous_responses=previous_responses,
         )
         self.debug = debug
-        self.turbo = dspy.OpenAI(
-            model="gpt-4o-mini",
-            model_type="chat",
-            temperature=1.0,
-        )
-        dspy.settings.configure(lm=self.turbo)
+        # Prints each prompt and completion, for debugging only
+        self.inspect_history = inspect_history
+        # Borrowed from the shared registry and selected per call below
+        self.turbo = lm if lm is not None else get_lm()
         self.dspy_prog = dspy_prog
+        self.history = ActionHistory(max_tokens=history_max_tokens)
+        for action in self.previous_actions:
+            self.history.append(action)
+        for response in self.previous_responses:
+            self.history.receive_response(response)
+
+    def reset(self):
+        super().reset()
+        self.history.reset()
+
+    def clone(self, lm=None):
+        return PromptAgent(
+            dspy_prog=self.dspy_prog,
+            max_actions=self.max_actions,
+            verbose=self.verbose,
+            logging=self.logging,
+            previous_actions=list(self.previous_actions),
+            previous_reasons=list(self.previous_reasons),
+            previous_responses=list(self.previous_responses),
+            debug=self.debug,
+            lm=lm if lm is not None else self.turbo,
+            history_max_tokens=self.history.max_tokens,
+            inspect_history=self.inspect_history,
+        )
+
+    def restore_state(self, state):
+        super().restore_state(state)
+        self.history.reset()
+        for action in self.previous_actions:
+            self.history.append(action)
+        for response in self.previous_responses:
+            self.history.receive_response(response)
 
     def previous_history(self):
-        previous_history = []
+        return self.history.previous_history()
 
-        if len(self.previous_actions) == len(self.previous_responses):
-            previous_history.extend(
-                [
-                    PreviousActionAndState(action=action, response=response)
-                    for action, response in zip(
-                        self.previous_actions, self.previous_responses
-                    )
-                ]
-            )
-        else:
-            previous_history = [
-                PreviousActionAndState(action=action, response=None)
-                for action in self.previous_actions
-            ]
+    def update_history(self, action, reason):
+        super().update_history(action=action, reason=reason)
+        if action:
+            self.history.append(action)
 
-        return previous_history
+    def receive_response(self, response):
+        super().receive_response(response)
+        self.history.receive_response(response)
 
+    @traced("lm_predict")
     def predict_action(self, objective, observation, url=None):
-        dspy_response = self.dspy_prog(
-            objective=objective,
-            observation=observation,
-            url=url,
-            previous_actions=self.previous_history(),
-        )
+        with dspy.settings.context(lm=metered_lm(recording_lm(self.turbo))):
+            dspy_response = self.dspy_prog(
+                objective=objective,
+                observation=observation,
+                url=url,
+                previous_actions=self.previous_history(),
+            )
 
-        self.turbo.inspect_history(1)
+        if self.inspect_history:
+            self.turbo.inspect_history(1)
 
         action = dspy_response.next_action
         # reason = dspy_response.reasoning
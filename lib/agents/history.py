@@ -0,0 +1,90 @@
+from collections import Counter
+
+from lib.modules.history_models import PreviousActionAndState
+from lib.utils.tokens import estimate_tokens
+
+
+class ActionHistory:
+    """
+    Incremental history of (action, response) pairs for a PromptAgent.
+    Entries are appended once per step and the prompt view is cached until
+    the history changes. The view collapses consecutive repeats and keeps the
+    most recent entries within max_tokens, older entries are folded into a
+    single summary entry.
+    """
+
+    def __init__(self, max_tokens=1000):
+        self.max_tokens = max_tokens
+        self.entries = []
+        self.num_responses = 0
+        self.view = None
+
+    def __len__(self):
+        return len(self.entries)
+
+    def reset(self):
+        self.entries = []
+        self.num_responses = 0
+        self.view = None
+
+    def append(self, action):
+        self.entries.append(PreviousActionAndState(action=action, response=None))
+        self.view = None
+
+    def receive_response(self, response):
+        # Responses pair up with actions in order, like previous_responses did
+        if self.num_responses < len(self.entries):
+            self.entries[self.num_responses].response = response
+            self.view = None
+        self.num_responses += 1
+
+    def collapsed(self):
+        collapsed = []
+        repeats = 1
+        for entry in self.entries:
+            previous = collapsed[-1][0] if collapsed else None
+            if (
+                previous is not None
+                and previous.action == entry.action
+                and previous.response == entry.response
+            ):
+                repeats += 1
+                collapsed[-1] = (previous, repeats)
+                continue
+            repeats = 1
+            collapsed.append((entry, repeats))
+        return [
+            entry if repeats == 1 else self.repeated(entry, repeats)
+            for entry, repeats in collapsed
+        ]
+
+    def repeated(self, entry, repeats):
+        response = f"{entry.response or ''} (repeated {repeats} times)".strip()
+        return PreviousActionAndState(action=entry.action, response=response)
+
+    def summarize(self, entries):
+        counts = Counter(entry.action.split(" ", 1)[0] for entry in entries)
+        summary = ", ".join(f"{action} x{count}" for action, count in counts.items())
+        return PreviousActionAndState(
+            action=f"{len(entries)} earlier actions", response=summary
+        )
+
+    def previous_history(self):
+        if self.view is not None:
+            return self.view
+
+        entries = self.collapsed()
+        kept = []
+        budget = self.max_tokens
+        for entry in reversed(entries):
+            if budget is not None:
+                cost = estimate_tokens(str(entry))
+                if cost > budget:
+                    break
+                budget -= cost
+            kept.append(entry)
+        kept.reverse()
+
+        folded = entries[: len(entries) - len(kept)]
+        self.view = ([self.summarize(folded)] if folded else []) + kept
+        return self.view
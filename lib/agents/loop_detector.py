@@ -0,0 +1,101 @@
+import hashlib
+import threading
+
+from lib.utils.tokens import estimate_tokens
+
+LOOP_POLICIES = ("hint", "pop", "stop")
+STOP_ACTION = "stop [N/A]"
+
+HINTS = {
+    "noop": "The previous action did not change the page, do not repeat it, "
+    "try a different action.",
+    "cycle": "The previous actions went back and forth between the same pages, "
+    "try a different approach.",
+}
+
+
+def step_fingerprint(url, observation, action):
+    observation_hash = hashlib.sha1((observation or "").encode("utf-8")).hexdigest()
+    return (url, observation_hash[:16], str(action).strip())
+
+
+class LoopDetector:
+    """
+    Spots steps that make no progress from the (URL, observation hash, action)
+    fingerprints of a stack frame: a no-op repeats the previous fingerprint
+    (same action on an unchanged page), a cycle repeats the last 2 to
+    max_cycle_length fingerprints. The policy says what the agent does about
+    it: "hint" tells the LM and asks again once, "pop" abandons the
+    subroutine and "stop" ends the task.
+    """
+
+    def __init__(self, policy="hint", max_cycle_length=4, max_steps=50):
+        if policy not in LOOP_POLICIES:
+            raise ValueError(f"Unknown loop policy {policy}, one of {LOOP_POLICIES}")
+        self.policy = policy
+        self.max_cycle_length = max_cycle_length
+        self.max_steps = max_steps
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.steps = 0
+        self.counters = {
+            "loop_detections": 0,
+            "loop_steps_saved": 0,
+            "loop_tokens_saved": 0,
+        }
+
+    def check(self, fingerprints, url, observation, action):
+        """
+        Appends the step to the frame's fingerprints and returns "noop",
+        "cycle" or None.
+        """
+        fingerprint = step_fingerprint(url, observation, action)
+        fingerprints.append(fingerprint)
+        with self.lock:
+            self.steps += 1
+        if len(fingerprints) >= 2 and fingerprints[-2] == fingerprint:
+            return "noop"
+        for length in range(2, self.max_cycle_length + 1):
+            if len(fingerprints) < 2 * length:
+                break
+            if fingerprints[-length:] == fingerprints[-2 * length : -length]:
+                return "cycle"
+        return None
+
+    def hint(self, loop):
+        return HINTS[loop]
+
+    def saved(self, observation, steps=1):
+        """
+        Counts steps that are not taken, each one a browser step and an LM
+        call with a prompt at least the size of the observation.
+        """
+        with self.lock:
+            self.counters["loop_steps_saved"] += steps
+            self.counters["loop_tokens_saved"] += steps * estimate_tokens(
+                observation or ""
+            )
+
+    def detected(self, observation):
+        with self.lock:
+            self.counters["loop_detections"] += 1
+        self.saved(observation)
+
+    def stopped(self, observation):
+        # Stopping early also saves the rest of the step budget
+        self.saved(observation, steps=max(self.max_steps - self.steps, 0))
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters)
+
+    def state(self):
+        with self.lock:
+            return {"steps": self.steps, "counters": dict(self.counters)}
+
+    def load_state(self, state):
+        with self.lock:
+            self.steps = state["steps"]
+            self.counters = dict(state["counters"])
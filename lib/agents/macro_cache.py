@@ -0,0 +1,343 @@
+import fcntl
+import hashlib
+import json
+import os
+import re
+import threading
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional
+from urllib.parse import parse_qsl, urlsplit
+
+from lib.modules.action_parser import parse_action
+from lib.utils.accessibility_tree import parse_tree
+
+DEFAULT_MACRO_CACHE_PATH = "local_cache/macro_cache.json"
+MAX_MACROS_PER_KEY = 8
+
+ROLE_NAME_PATTERN = re.compile(r"(\w+)\s*'([^']*)'")
+NUMBER_PATTERN = re.compile(r"\d+(\.\d+)?")
+# Form controls make up the structure of a page, links and text mostly carry
+# its content (search results, routes) and are left out of the fingerprint.
+FORM_ROLES = {
+    "button",
+    "textbox",
+    "searchbox",
+    "combobox",
+    "checkbox",
+    "radio",
+    "tab",
+    "menuitem",
+}
+PARAMETER_ACTIONS = {"type", "select"}
+
+
+def url_template(url: str) -> str:
+    """
+    Reduces a URL to its structure: numbers in the path become {n}, query and
+    fragment only keep their parameter names, e.g.
+    "http://host/directions?route=1;2#map=17/40.4/-79.9" -> "http://host/directions?route#map".
+    """
+    parts = urlsplit(url or "")
+    path = NUMBER_PATTERN.sub("{n}", parts.path)
+    query = ",".join(sorted(key for key, _ in parse_qsl(parts.query)))
+    fragment = ",".join(
+        sorted(item.split("=", 1)[0] for item in parts.fragment.split("&") if item)
+    )
+    template = f"{parts.scheme}://{parts.netloc}{path}"
+    if query:
+        template += f"?{query}"
+    if fragment:
+        template += f"#{fragment}"
+    return template
+
+
+def role_and_name(content: str):
+    match = ROLE_NAME_PATTERN.match(content)
+    if match is None:
+        return None, None
+    return match.group(1), match.group(2)
+
+
+def page_fingerprint(url: str, observation: str) -> str:
+    """
+    Hash of the URL template and the role/name skeleton of the page's form
+    controls. Element ids and the content of the page do not affect it.
+    """
+    skeleton = []
+    for node in parse_tree(observation):
+        role, name = role_and_name(node.content)
+        if role in FORM_ROLES:
+            skeleton.append(f"{node.depth}:{role}:{name}")
+    payload = url_template(url) + "\n" + "\n".join(skeleton)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def element_target(observation: str, element_id: str):
+    """
+    Describes an element by role, name and its occurrence among elements with
+    the same role and name, which unlike the id is stable across page loads.
+    """
+    seen: Dict = {}
+    for node in parse_tree(observation):
+        role, name = role_and_name(node.content)
+        if role is None:
+            continue
+        occurrence = seen.get((role, name), 0)
+        seen[(role, name)] = occurrence + 1
+        if node.node_id == element_id:
+            return [role, name, occurrence]
+    return None
+
+
+def resolve_target(observation: str, target) -> Optional[str]:
+    role, name, occurrence = target
+    for node in parse_tree(observation):
+        if role_and_name(node.content) == (role, name):
+            if occurrence == 0:
+                return node.node_id
+            occurrence -= 1
+    return None
+
+
+@dataclass
+class MacroStep:
+    fingerprint: str
+    name: str
+    target: Optional[list]
+    # Literal values, or {"slot": i} for values taken from the argument
+    args: list
+
+
+@dataclass
+class Macro:
+    subroutine: str
+    argument_pattern: str
+    steps: List[MacroStep] = field(default_factory=list)
+
+    def bind(self, argument: str) -> Optional[List[str]]:
+        match = re.fullmatch(
+            self.argument_pattern, argument, re.IGNORECASE | re.DOTALL
+        )
+        if match is None:
+            return None
+        return list(match.groups())
+
+    @classmethod
+    def from_dict(cls, data):
+        steps = [MacroStep(**step) for step in data["steps"]]
+        return cls(data["subroutine"], data["argument_pattern"], steps)
+
+
+def subroutine_argument(objective: str) -> str:
+    action = parse_action(objective)
+    return action.answer if action is not None else ""
+
+
+def parameterize(argument: str, steps: List[MacroStep]) -> str:
+    """
+    Replaces the values typed or selected by the steps that appear in the
+    subroutine argument with slots, and returns the pattern an argument has to
+    match for the macro to be replayed with it. The steps are updated in place
+    to refer to the slots.
+    """
+    lowered = argument.lower()
+    spans = []  # (start, end, slot)
+    slots: Dict[str, int] = {}
+    for step in steps:
+        # Only the typed content and the selected option can be parameters
+        if step.name not in PARAMETER_ACTIONS or not step.args:
+            continue
+        key = step.args[0].lower()
+        if not key.strip():
+            continue
+        if key not in slots:
+            start = lowered.find(key)
+            end = start + len(key)
+            if start < 0 or any(s < end and start < e for s, e, _ in spans):
+                continue
+            slots[key] = len(slots)
+            spans.append((start, end, slots[key]))
+        step.args[0] = {"slot": slots[key]}
+
+    # Groups have to be in the order of the slots
+    spans.sort()
+    order = {slot: position for position, (_, _, slot) in enumerate(spans)}
+    for step in steps:
+        for i, value in enumerate(step.args):
+            if isinstance(value, dict):
+                step.args[i] = {"slot": order[value["slot"]]}
+
+    pattern, position = "", 0
+    for start, end, _ in spans:
+        pattern += re.escape(argument[position:start]) + "(.+?)"
+        position = end
+    return pattern + re.escape(argument[position:])
+
+
+class MacroCache:
+    """
+    Successful low-level action sequences of subroutines, keyed by subroutine
+    name and the fingerprint of the page the subroutine started on.
+    Values that came from the subroutine argument are stored as slots, so a
+    macro recorded for "find directions from A to B" replays for "from C to D".
+    With a path the macros are shared through a JSON file.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.lock = threading.Lock()
+        self.macros: Dict[str, List[Macro]] = {}
+        self.counters = {"hits": 0, "misses": 0, "diverged": 0, "steps_replayed": 0}
+        if self.path and os.path.exists(self.path):
+            with open(self.path, "r") as f:
+                self.macros = self.decode(json.load(f))
+
+    @staticmethod
+    def key(subroutine, fingerprint):
+        return f"{subroutine}:{fingerprint}"
+
+    @staticmethod
+    def decode(data):
+        return {
+            key: [Macro.from_dict(macro) for macro in macros]
+            for key, macros in data.items()
+        }
+
+    def count(self, counter, n=1):
+        with self.lock:
+            self.counters[counter] += n
+
+    def lookup(self, subroutine, argument, fingerprint):
+        """
+        Returns the most recent macro for the page whose argument pattern
+        matches, with the slot values bound from the argument.
+        """
+        with self.lock:
+            macros = list(self.macros.get(self.key(subroutine, fingerprint), []))
+        for macro in macros:
+            bindings = macro.bind(argument)
+            if bindings is not None:
+                self.count("hits")
+                return macro, bindings
+        self.count("misses")
+        return None, None
+
+    def put(self, subroutine, objective, steps: List[MacroStep]):
+        if not steps:
+            return
+        argument = subroutine_argument(objective)
+        macro = Macro(subroutine, parameterize(argument, steps), steps)
+        with self.lock:
+            self.add(self.macros, macro)
+            if self.path:
+                self.save(macro)
+
+    def add(self, macros, macro):
+        key = self.key(macro.subroutine, macro.steps[0].fingerprint)
+        entries = [m for m in macros.get(key, []) if asdict(m) != asdict(macro)]
+        macros[key] = [macro] + entries[: MAX_MACROS_PER_KEY - 1]
+
+    def save(self, macro):
+        # Merge with what other processes wrote, under an exclusive lock
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "a+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                content = f.read()
+                macros = self.decode(json.loads(content)) if content else {}
+                self.add(macros, macro)
+                f.seek(0)
+                f.truncate()
+                json.dump(
+                    {
+                        key: [asdict(m) for m in entries]
+                        for key, entries in macros.items()
+                    },
+                    f,
+                )
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+        self.macros = macros
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters)
+
+
+class MacroReplay:
+    """
+    Replays a macro step by step within a subroutine frame. Before every step
+    the page fingerprint is verified and the target element is looked up by
+    role and name, any mismatch ends the replay.
+    """
+
+    def __init__(self, macro: Macro, bindings: List[str]):
+        self.macro = macro
+        self.bindings = bindings
+        self.index = 0
+
+    def next_action(self, observation, url) -> Optional[str]:
+        if self.index >= len(self.macro.steps):
+            return None
+        step = self.macro.steps[self.index]
+        if page_fingerprint(url, observation) != step.fingerprint:
+            return None
+        action = step_action(step, observation, self.bindings)
+        if action is not None:
+            self.index += 1
+        return action
+
+    def finished(self):
+        return self.index >= len(self.macro.steps)
+
+
+def step_action(step: MacroStep, observation, bindings=()) -> Optional[str]:
+    """
+    The action of a step with its target resolved to an element id of the
+    observation, or None when the element is not on the page.
+    """
+    args = [
+        bindings[value["slot"]] if isinstance(value, dict) else value
+        for value in step.args
+    ]
+    if step.target is not None:
+        element_id = resolve_target(observation, step.target)
+        if element_id is None:
+            return None
+        args = [element_id] + args
+    return " ".join([step.name] + [f"[{arg}]" for arg in args])
+
+
+def record_step(observation, url, action) -> Optional[MacroStep]:
+    """
+    Turns a low-level action into a macro step, or None when the action can
+    not be replayed on another page load.
+    """
+    action = parse_action(action)
+    if action is None:
+        return None
+    target, args = None, list(action.args)
+    if action.element_id is not None:
+        target = element_target(observation, action.element_id)
+        if target is None:
+            return None
+        args = args[1:]
+    return MacroStep(page_fingerprint(url, observation), action.name, target, args)
+
+
+_macro_cache = None
+
+
+def get_macro_cache():
+    """
+    Process wide macro cache, configured through MACRO_CACHE_PATH (empty
+    disables it).
+    """
+    global _macro_cache
+    path = os.getenv("MACRO_CACHE_PATH", DEFAULT_MACRO_CACHE_PATH)
+    if not path:
+        return None
+    if _macro_cache is None or _macro_cache.path != path:
+        _macro_cache = MacroCache(path=path)
+    return _macro_cache
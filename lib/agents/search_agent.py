@@ -0,0 +1,363 @@
+import contextvars
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+import dspy
+
+from lib.agents.agent import Agent
+from lib.agents.macro_cache import MacroStep, record_step, step_action
+from lib.agents.step_agent import StepAgent
+from lib.environments.browser_pool import BrowserPool
+from lib.environments.webarena import WebArenaEnvironmentWrapper
+from lib.modules.lm_registry import get_lm
+from lib.utils.llm_cache import normalize_observation
+from lib.utils.usage import BudgetExceeded, metered_lm, use_usage
+
+
+class SearchBudgetExceeded(Exception):
+    pass
+
+
+class CountingLM:
+    """
+    Proxy around a dspy LM that enforces the search's LM call budget.
+    """
+
+    def __init__(self, lm, budget):
+        self.lm = lm
+        self.budget = budget
+
+    def __getattr__(self, name):
+        return getattr(self.lm, name)
+
+    def __call__(self, prompt, **kwargs):
+        self.budget.spend()
+        return self.lm(prompt, **kwargs)
+
+    def copy(self, **kwargs):
+        return CountingLM(self.lm.copy(**kwargs), self.budget)
+
+
+class SearchBudget:
+    def __init__(self, max_lm_calls):
+        self.max_lm_calls = max_lm_calls
+        self.lm_calls = 0
+        self.lock = threading.Lock()
+
+    def spend(self):
+        with self.lock:
+            if self.lm_calls >= self.max_lm_calls:
+                raise SearchBudgetExceeded(f"LM call budget {self.max_lm_calls} spent")
+            self.lm_calls += 1
+
+    def exhausted(self):
+        return self.lm_calls >= self.max_lm_calls
+
+
+class ReplayError(Exception):
+    pass
+
+
+@dataclass
+class SearchNode:
+    """
+    A search state: the snapshot of the page it is on, plus the steps taken on
+    that page since it was loaded (typed input is not part of a snapshot).
+    Steps target elements by role and name, as element ids differ between
+    browser contexts. tree is the full accessibility tree of the state.
+    """
+
+    agent: StepAgent
+    snapshot: dict
+    observation: str
+    url: str
+    tree: str
+    actions: List[str] = field(default_factory=list)
+    path: List[MacroStep] = field(default_factory=list)
+    page_steps: List[MacroStep] = field(default_factory=list)
+    value: float = 0.0
+    terminal: bool = False
+    status: Optional[dict] = None
+
+
+def replay(env, step):
+    action = step_action(step, env.obs["text"])
+    if action is None:
+        raise ReplayError(f"{step.name} target {step.target} is not on the page")
+    return action, env.step(action)
+
+
+class BranchEnvironment:
+    """
+    A browser context used to expand search branches. It lives on its own
+    thread, as Playwright's sync objects are bound to the thread that created
+    them, and keeps Chromium warm through a BrowserPool.
+    """
+
+    def __init__(self, config_file, env_kwargs, wrapper_kwargs):
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.env = self.executor.submit(
+            lambda: WebArenaEnvironmentWrapper(
+                config_file=config_file,
+                browser_pool=BrowserPool(max_tasks_per_browser=10**9),
+                **wrapper_kwargs,
+                **env_kwargs,
+            )
+        ).result()
+
+    def expand(self, node, step, query):
+        return self.executor.submit(self._expand, node, step, query)
+
+    def _expand(self, node, step, query):
+        """
+        Restores the node's page, replays the steps taken on it and takes the
+        new step. Returns the resulting observation, URL, snapshot, the steps
+        taken on the resulting page, the full tree and the status.
+        """
+        self.env.restore(node.snapshot)
+        for page_step in node.page_steps:
+            replay(self.env, page_step)
+        _, status = replay(self.env, step)
+        observation = self.env.observation(query=query)
+        url = self.env.get_url()
+        if url == node.snapshot["url"]:
+            snapshot, page_steps = node.snapshot, node.page_steps + [step]
+        else:
+            snapshot, page_steps = self.env.snapshot(), []
+        return observation, url, snapshot, page_steps, self.env.obs["text"], status
+
+    def close(self):
+        def close():
+            self.env.close()
+            self.env.browser_pool.close()
+
+        self.executor.submit(close).result()
+        self.executor.shutdown()
+
+
+def observation_hash(url, observation):
+    content = f"{url}\n{normalize_observation(observation)}"
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class SearchAgent(Agent):
+    """
+    Beam search over StepAgent policies.
+    Every state in the beam samples num_samples candidate actions, candidates
+    are expanded in parallel browser contexts restored from storage state and
+    URL snapshots (replaying the steps taken on the page since it loaded), and
+    the resulting states are scored in one batched value call and pruned to
+    beam_width. States whose observation was already seen are not expanded
+    again. The best path is then replayed on the task env, with elements
+    looked up by role and name.
+    """
+
+    def __init__(
+        self,
+        max_actions: int = 50,
+        verbose: bool = False,
+        logging: bool = False,
+        debug: bool = False,
+        beam_width: int = 3,
+        num_samples: int = 3,
+        max_depth: int = 15,
+        max_lm_calls: int = 200,
+        max_contexts: int = 4,
+        lm=None,
+    ):
+        super().__init__(
+            max_actions=max_actions,
+            verbose=verbose,
+            logging=logging,
+            previous_actions=[],
+            previous_reasons=[],
+            previous_responses=[],
+        )
+        self.debug = debug
+        self.beam_width = beam_width
+        self.num_samples = num_samples
+        self.max_depth = max_depth
+        self.max_contexts = max_contexts
+        self.budget = SearchBudget(max_lm_calls)
+        self.lm = CountingLM(lm if lm is not None else get_lm(), self.budget)
+        # Imported here, like the subroutine modules the dspy modules are only
+        # loaded by the agents that use them
+        from lib.modules.dspy_modules import StateValueModule
+
+        self.value_module = StateValueModule()
+        self.visited = set()
+
+    def sample(self, node, index, objective):
+        # Each sample gets a slightly different temperature so requests are
+        # not served from the same cache entry
+        temperature = self.lm.kwargs.get("temperature", 1.0) + 0.01 * index
+        agent = node.agent.clone(lm=self.lm.copy(temperature=temperature))
+        action, _ = agent.predict_action(
+            objective=objective, observation=node.observation, url=node.url
+        )
+        return node, agent, action
+
+    def score(self, objective, nodes):
+        if not nodes:
+            return
+        states = [
+            f"URL: {node.url}\nActions: {node.actions}\n"
+            f"Observation: {node.observation[:2000]}"
+            for node in nodes
+        ]
+        try:
+            with dspy.settings.context(lm=metered_lm(self.lm)):
+                scores = self.value_module(objective=objective, states=states).scores
+        except Exception as e:
+            print(f"Value call failed: {e}")
+            scores = []
+        if len(scores) != len(nodes):
+            scores = [0.0] * len(nodes)
+        for node, score in zip(nodes, scores):
+            node.value = float(score)
+
+    def search(self, objective, root, branches):
+        beam, terminals = [root], []
+        with ThreadPoolExecutor(
+            max_workers=max(self.beam_width * self.num_samples, 1)
+        ) as pool:
+            for depth in range(self.max_depth):
+                if self.budget.exhausted():
+                    break
+                # Each sample runs in the task's context, so its LM calls are
+                # traced, recorded and metered with the task
+                futures = [
+                    pool.submit(
+                        contextvars.copy_context().run,
+                        self.sample,
+                        node,
+                        index,
+                        objective,
+                    )
+                    for node in beam
+                    for index in range(self.num_samples)
+                ]
+                candidates, seen = [], set()
+                for future in futures:
+                    try:
+                        node, agent, action = future.result()
+                    except (SearchBudgetExceeded, BudgetExceeded):
+                        continue
+                    except Exception as e:
+                        print(f"Sample failed: {e}")
+                        continue
+                    if (id(node), action) not in seen:
+                        seen.add((id(node), action))
+                        candidates.append((node, agent, action))
+
+                children = []
+                expansions = []
+                for i, (node, agent, action) in enumerate(candidates):
+                    step = record_step(node.tree, node.url, action)
+                    if step is None:
+                        print(f"Skipping {action}, its element is not on the page")
+                        continue
+                    child = SearchNode(
+                        agent=agent,
+                        snapshot=node.snapshot,
+                        observation=node.observation,
+                        url=node.url,
+                        tree=node.tree,
+                        actions=node.actions + [action],
+                        path=node.path + [step],
+                    )
+                    if agent.is_done(action):
+                        child.terminal = True
+                        children.append(child)
+                        continue
+                    branch = branches[i % len(branches)]
+                    expansions.append((child, branch.expand(node, step, objective)))
+                for child, future in expansions:
+                    try:
+                        observation, url, snapshot, page_steps, tree, status = (
+                            future.result()
+                        )
+                    except Exception as e:
+                        print(f"Expansion of {child.actions[-1]} failed: {e}")
+                        continue
+                    key = observation_hash(url, observation)
+                    if key in self.visited:
+                        continue
+                    self.visited.add(key)
+                    child.observation, child.url, child.tree = observation, url, tree
+                    child.snapshot, child.page_steps = snapshot, page_steps
+                    child.status = status
+                    children.append(child)
+
+                if not children:
+                    break
+                self.score(objective, children)
+                terminals.extend(child for child in children if child.terminal)
+                beam = sorted(
+                    (child for child in children if not child.terminal),
+                    key=lambda child: -child.value,
+                )[: self.beam_width]
+                if self.verbose:
+                    print(
+                        f"[Search depth {depth}] {len(children)} children, "
+                        f"best {beam[0].value if beam else None}, "
+                        f"{self.budget.lm_calls} LM calls"
+                    )
+                if not beam:
+                    break
+        return max(terminals or beam or [root], key=lambda node: node.value)
+
+    def act(self, objective, env):
+        with use_usage(self.usage):
+            return self.act_status(self._act(objective, env))
+
+    def _act(self, objective, env):
+        observation = env.observation(query=objective)
+        root = SearchNode(
+            agent=StepAgent(
+                max_actions=self.max_actions, verbose=False, debug=False, lm=self.lm
+            ),
+            snapshot=env.snapshot(),
+            observation=observation,
+            url=env.get_url(),
+            tree=env.obs["text"],
+        )
+        self.visited.add(observation_hash(root.url, observation))
+
+        branches = [
+            BranchEnvironment(env.config_file, env.env_kwargs, env.wrapper_kwargs)
+            for _ in range(self.max_contexts)
+        ]
+        try:
+            best = self.search(objective, root, branches)
+        finally:
+            for branch in branches:
+                branch.close()
+
+        # Replay the chosen path on the task environment for evaluation, with
+        # the element ids of the task environment's own pages
+        status = env.status()
+        for step in best.path:
+            if env.done():
+                break
+            observation = env.observation(query=objective)
+            try:
+                action, status = replay(env, step)
+            except ReplayError as e:
+                print(f"Replay of the search path diverged: {e}")
+                break
+            self.update_history(action=action, reason=None)
+            if self.logging:
+                self.log_step(
+                    objective=objective,
+                    url=env.get_url(),
+                    observation=observation,
+                    action=action,
+                    reason=None,
+                    status=status,
+                )
+        status = {**status, "search_lm_calls": self.budget.lm_calls}
+        return status
@@ -1,14 +1,22 @@
 from lib.agents.agent import Agent
 from lib.utils.stack import Stack
+from lib.utils.recording import record
+from lib.utils.tracing import traced
+from lib.utils.usage import UsageMeter, task_budget, use_usage
 from lib.agents.dspy_agent import PromptAgent
-from lib.modules.dspy_modules import (
-    MapPlanningModule,
-    FindDirectionModule,
-    SearchNearestPlaceModule,
+from lib.agents.loop_detector import STOP_ACTION, LoopDetector
+from lib.agents.macro_cache import (
+    MacroReplay,
+    get_macro_cache,
+    page_fingerprint,
+    record_step,
+    subroutine_argument,
 )
+from lib.modules.action_parser import parse_action
+from lib.modules.subroutines import SubroutineModules
 
 from typing import List, Dict
-import re
+import copy
 
 
 class StepAgent(Agent):
@@ -20,11 +28,14 @@ class StepAgent(Agent):
         previous_actions: List[str] = [],
         debug: bool = False,
         root_action: str = "map_planner",
-        action_to_prompt_dict: Dict = {
-            "map_planner": MapPlanningModule(),
-            "find_directions": FindDirectionModule(),
-            "search_nearest_place": SearchNearestPlaceModule(),
-        },
+        action_to_prompt_dict: Dict = None,
+        lm=None,
+        history_max_tokens: int = 1000,
+        macro_cache=None,
+        loop_policy: str = "hint",
+        max_task_tokens=None,
+        max_task_cost=None,
+        inspect_history: bool = False,
     ):
         super().__init__(
             max_actions=max_actions,
@@ -34,18 +45,171 @@ class StepAgent(Agent):
         )
         self.debug = debug
         self.root_action = root_action
-        self.action_to_prompt_dict = action_to_prompt_dict
+        # Modules come from the subroutine registry and are built on first use
+        self.action_to_prompt_dict = (
+            action_to_prompt_dict
+            if action_to_prompt_dict is not None
+            else SubroutineModules()
+        )
         self.stack = Stack()
+        self.lm = lm
+        self.history_max_tokens = history_max_tokens
+        self.macro_cache = (
+            macro_cache if macro_cache is not None else get_macro_cache()
+        )
+        self.loop_policy = loop_policy
+        self.inspect_history = inspect_history
+        budget = task_budget()
+        self.usage = UsageMeter(
+            name="task",
+            max_tokens=max_task_tokens or budget["max_tokens"],
+            max_cost=max_task_cost or budget["max_cost"],
+        )
+        # LM usage rolled up per subroutine, over all its frames
+        self.subroutine_usage = {}
+        if loop_policy is not None:
+            self.loop_detector = LoopDetector(policy=loop_policy, max_steps=max_actions)
+
+    def clone(self, lm=None):
+        """
+        Copies the agent and its stack of subroutine agents, optionally
+        switching every frame to another LM.
+        """
+        agent = StepAgent(
+            max_actions=self.max_actions,
+            verbose=self.verbose,
+            logging=self.logging,
+            previous_actions=list(self.previous_actions),
+            debug=self.debug,
+            root_action=self.root_action,
+            action_to_prompt_dict=self.action_to_prompt_dict,
+            lm=lm if lm is not None else self.lm,
+            history_max_tokens=self.history_max_tokens,
+            macro_cache=self.macro_cache,
+            loop_policy=self.loop_policy,
+            max_task_tokens=self.usage.max_tokens,
+            max_task_cost=self.usage.max_cost,
+            inspect_history=self.inspect_history,
+        )
+        for element in self.stack.items:
+            copied = {**element, "agent": element["agent"].clone(lm=lm)}
+            copied["fingerprints"] = list(element.get("fingerprints", []))
+            if copied.get("macro_steps"):
+                copied["macro_steps"] = list(copied["macro_steps"])
+            if copied.get("replay") is not None:
+                copied["replay"] = copy.copy(copied["replay"])
+            agent.stack.push(copied)
+        return agent
+
+    def checkpoint_state(self):
+        """
+        Adds the stack: for each frame its objective, the subroutine it runs
+        (None for the root module) and the history of its PromptAgent.
+        """
+        state = super().checkpoint_state()
+        state["stack"] = [
+            {
+                "objective": element["objective"],
+                "subroutine": element.get("subroutine"),
+                "agent": element["agent"].checkpoint_state(),
+                "fingerprints": list(element.get("fingerprints", [])),
+                "loop_hinted": element.get("loop_hinted", False),
+                "macro_steps": (
+                    list(element["macro_steps"])
+                    if element.get("macro_steps") is not None
+                    else None
+                ),
+            }
+            for element in self.stack.items
+        ]
+        state["subroutine_usage"] = {
+            name: meter.state() for name, meter in self.subroutine_usage.items()
+        }
+        return state
+
+    def restore_state(self, state):
+        super().restore_state(state)
+        self.stack.items.clear()
+        for frame in state["stack"]:
+            if frame["subroutine"] is None:
+                element = self.init_root_agent(frame["objective"])
+            else:
+                # The objective of a subroutine frame is the action that called it
+                element = self.init_agent(frame["objective"])
+                element["macro_steps"] = frame["macro_steps"]
+                # A macro replay in progress is not resumed, the LM takes over
+                element["macro_checked"] = True
+            element["agent"].restore_state(frame["agent"])
+            element["fingerprints"] = list(frame["fingerprints"])
+            if frame["loop_hinted"]:
+                element["loop_hinted"] = True
+            self.stack.push(element)
+        self.subroutine_usage = {}
+        for name, meter_state in state["subroutine_usage"].items():
+            self.subroutine_usage[name] = UsageMeter(name=name)
+            self.subroutine_usage[name].load_state(meter_state)
 
     def is_done(self, action):
-        return "stop" in action.lower()
+        action = parse_action(action)
+        return action is not None and action.is_stop
 
     def is_high_level_action(self, action):
-        return any(filter(lambda x: x in action, self.action_to_prompt_dict.keys()))
+        action = parse_action(action)
+        return (
+            action is not None
+            and action.name != self.root_action
+            and action.name in self.action_to_prompt_dict
+        )
 
     def is_low_level_action(self, action):
         return not self.is_high_level_action(action)
 
+    def frame_usage(self, element):
+        name = element.get("subroutine", self.root_action)
+        if name not in self.subroutine_usage:
+            self.subroutine_usage[name] = UsageMeter(name=name)
+        return self.subroutine_usage[name]
+
+    def act_status(self, status):
+        status = super().act_status(status)
+        status["lm_usage_by_subroutine"] = {
+            name: meter.summary(prefix="")
+            for name, meter in self.subroutine_usage.items()
+        }
+        return status
+
+    def guard_loop(self, objective, observation, url, action, reason):
+        # Loops are detected per stack frame in predict_action
+        return action, reason
+
+    def handle_loop(self, element, loop, observation, url, action):
+        """
+        Applies the loop policy to the frame that predicted a looping action.
+        Returns the action to take instead, or None to predict again.
+        """
+        detector = self.loop_detector
+        record("loop", loop=loop, action=action, policy=detector.policy)
+        detector.detected(observation)
+        if detector.policy == "hint" and not element.get("loop_hinted"):
+            element["loop_hinted"] = True
+            element["agent"].receive_response(detector.hint(loop))
+            return None
+        element["agent"].receive_response("")
+        if detector.policy != "stop" and self.stack.size() > 1:
+            # Abandon the subroutine, its caller decides what to do next
+            self.stack.pop()
+            record("stack", op="pop", objective=element["objective"], action=action)
+            self.stack.peek()["agent"].receive_response("N/A")
+            return None
+        detector.stopped(observation)
+        self.stack.items.clear()
+        return STOP_ACTION
+
+    def observation_query(self, objective):
+        if self.stack.is_empty():
+            return objective
+        return f"{objective} {self.stack.peek()['objective']}"
+
     def init_root_agent(self, objective):
         dspy_prog = self.action_to_prompt_dict[self.root_action]
         agent = PromptAgent(
@@ -54,6 +218,9 @@ class StepAgent(Agent):
             verbose=self.verbose,
             logging=self.logging,
             debug=self.debug,
+            lm=self.lm,
+            history_max_tokens=self.history_max_tokens,
+            inspect_history=self.inspect_history,
             previous_actions=[],
             previous_reasons=[],
             previous_responses=[],
@@ -61,10 +228,8 @@ class StepAgent(Agent):
         return {"agent": agent, "objective": objective}
 
     def init_agent(self, action):
-        pattern = r"(\w+)\s+\[(.*?)\]"
-        matches = re.findall(pattern, action)
-        action_type, _ = matches[0]
-        objective = action
+        action_type = parse_action(action).name  # type: ignore
+        objective = str(action)
         dspy_prog = self.action_to_prompt_dict[action_type]
         agent = PromptAgent(
             dspy_prog=dspy_prog,
@@ -72,29 +237,114 @@ class StepAgent(Agent):
             verbose=self.verbose,
             logging=self.logging,
             debug=self.debug,
+            lm=self.lm,
+            history_max_tokens=self.history_max_tokens,
+            inspect_history=self.inspect_history,
             previous_actions=[],
             previous_reasons=[],
             previous_responses=[],
         )
-        return {"agent": agent, "objective": objective}
+        return {
+            "agent": agent,
+            "objective": objective,
+            "subroutine": action_type,
+            "macro_steps": [],
+            "replay": None,
+            "macro_checked": False,
+        }
+
+    def macro_action(self, element, observation, url):
+        """
+        Next action of a cached macro for the subroutine frame, or None when
+        there is no macro or the page no longer matches it, in which case the
+        LM takes over for the rest of the frame.
+        """
+        if self.macro_cache is None or "subroutine" not in element:
+            return None
+        if not element["macro_checked"]:
+            element["macro_checked"] = True
+            macro, bindings = self.macro_cache.lookup(
+                element["subroutine"],
+                subroutine_argument(element["objective"]),
+                page_fingerprint(url, observation),
+            )
+            if macro is not None:
+                element["replay"] = MacroReplay(macro, bindings)
+        replay = element["replay"]
+        if replay is None:
+            return None
+        action = replay.next_action(observation, url)
+        if action is None:
+            element["replay"] = None
+            if not replay.finished():
+                self.macro_cache.count("diverged")
+            return None
+        self.macro_cache.count("steps_replayed")
+        return action
+
+    def record_macro_step(self, element, observation, url, action):
+        if "macro_steps" not in element or element["macro_steps"] is None:
+            return
+        step = record_step(observation, url, action)
+        if step is None:
+            # Not replayable, the subroutine is not cached
+            element["macro_steps"] = None
+            return
+        element["macro_steps"].append(step)
+
+    def store_macro(self, element, action):
+        if self.macro_cache is None or not element.get("macro_steps"):
+            return
+        # A subroutine that gave up is not worth replaying
+        if action.answer.strip().lower() in ("", "n/a"):
+            return
+        self.macro_cache.put(
+            element["subroutine"], element["objective"], element["macro_steps"]
+        )
 
+    @traced("step_agent_predict")
     def predict_action(self, objective, observation, url=None):
         if self.stack.is_empty():
             new_element = self.init_root_agent(objective=objective)
             self.stack.push(new_element)
+            record("stack", op="push", objective=new_element["objective"])
 
         action, reason = None, None
         while not self.stack.is_empty():
             element = self.stack.peek()
-            action, reason = element["agent"].predict_action(
-                objective=element["objective"], observation=observation, url=url
-            )
-            if (not self.is_done(action)) and self.is_low_level_action(action):
+            action = self.macro_action(element, observation, url)
+            if action is not None:
+                record("macro", objective=element["objective"], action=action)
+                element["agent"].update_history(action=action, reason="macro")
+                element["agent"].receive_response("")
+                self.record_macro_step(element, observation, url, action)
+                return action, "macro"
+            with use_usage(self.frame_usage(element)):
+                action, reason = element["agent"].predict_action(
+                    objective=element["objective"], observation=observation, url=url
+                )
+            parsed = parse_action(action)
+            if (not self.is_done(parsed)) and self.is_low_level_action(parsed):
+                loop = None
+                if self.loop_detector is not None:
+                    loop = self.loop_detector.check(
+                        element.setdefault("fingerprints", []),
+                        url,
+                        observation,
+                        action,
+                    )
+                if loop is not None:
+                    action = self.handle_loop(element, loop, observation, url, action)
+                    if action is None:
+                        continue
+                    return action, "loop"
                 element["agent"].receive_response("")
+                self.record_macro_step(element, observation, url, action)
                 return action, reason
-            if (not self.is_done(action)) and self.is_high_level_action(action):
-                new_element = self.init_agent(action)
+            if (not self.is_done(parsed)) and self.is_high_level_action(parsed):
+                new_element = self.init_agent(parsed)
                 self.stack.push(new_element)
+                record("stack", op="push", objective=new_element["objective"])
                 if self.logging:
                     self.log_step(
                         objective=element["objective"],
@@ -105,11 +355,15 @@ class StepAgent(Agent):
                         status={},
                     )
                 continue
-            if self.is_done(action):
+            if self.is_done(parsed):
+                self.store_macro(element, parsed)
                 self.stack.pop()
+                record(
+                    "stack", op="pop", objective=element["objective"], action=action
+                )
                 if not self.stack.is_empty():
                     self.stack.peek()["agent"].receive_response(
-                        re.search(r"\[(.*?)\]", action).group(1)  # type: ignore
+                        parsed.answer  # type: ignore
                     )
                 if self.logging:
                     self.log_step(
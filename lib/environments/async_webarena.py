@@ -0,0 +1,130 @@
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from lib.environments.browser_pool import BrowserPool
+from lib.environments.webarena import WebArenaEnvironmentWrapper
+
+
+class AsyncBrowserPool:
+    """
+    BrowserPool for the async environments. A warm browser can only be used
+    from the thread that launched it, so the pool keeps browser threads, each
+    with its own BrowserPool, and an environment leases a thread for the
+    length of its task. Used from a single event loop.
+    """
+
+    def __init__(self, max_tasks_per_browser=20, max_memory_mb=None):
+        self.max_tasks_per_browser = max_tasks_per_browser
+        self.max_memory_mb = max_memory_mb
+        self.threads = []
+        self.idle = []
+
+    def acquire(self):
+        if self.idle:
+            return self.idle.pop()
+        thread = (
+            ThreadPoolExecutor(max_workers=1),
+            BrowserPool(self.max_tasks_per_browser, self.max_memory_mb),
+        )
+        self.threads.append(thread)
+        return thread
+
+    def release(self, thread):
+        self.idle.append(thread)
+
+    def close(self):
+        for executor, pool in self.threads:
+            executor.submit(pool.close).result()
+            executor.shutdown()
+        self.threads = []
+        self.idle = []
+
+    def stats(self):
+        pools = [pool for _, pool in self.threads]
+        latencies = [latency for pool in pools for latency in pool.reset_latencies]
+        return {
+            "pool_threads": len(pools),
+            "pool_hits": sum(pool.hits for pool in pools),
+            "pool_misses": sum(pool.misses for pool in pools),
+            "pool_recycled": sum(pool.recycled for pool in pools),
+            "pool_mean_reset_latency": (
+                sum(latencies) / len(latencies) if latencies else 0.0
+            ),
+        }
+
+
+class AsyncWebArenaEnvironmentWrapper:
+    """
+    Asyncio facade over WebArenaEnvironmentWrapper.
+    Playwright's sync objects are bound to the thread that created them, so
+    every environment owns a single browser thread and all browser work is
+    dispatched to it. Many environments can then be awaited from one event loop.
+    With an AsyncBrowserPool the thread and its warm browsers are leased from
+    the pool and returned on aclose().
+    """
+
+    def __init__(self, browser_pool=None, **env_kwargs):
+        self.env_kwargs = env_kwargs
+        self.browser_pool = browser_pool
+        if browser_pool is not None:
+            self.thread = browser_pool.acquire()
+            self.executor, self.env_kwargs["browser_pool"] = self.thread
+        else:
+            self.thread = None
+            self.executor = ThreadPoolExecutor(max_workers=1)
+        self.env = None
+
+    async def run_in_browser_thread(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        # Carry the caller's context (e.g. the active tracer) into the thread
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(
+            self.executor, functools.partial(context.run, fn, *args)
+        )
+
+    @classmethod
+    async def create(cls, browser_pool=None, **env_kwargs):
+        wrapper = cls(browser_pool=browser_pool, **env_kwargs)
+        try:
+            wrapper.env = await wrapper.run_in_browser_thread(
+                lambda: WebArenaEnvironmentWrapper(**wrapper.env_kwargs)
+            )
+        except BaseException:
+            wrapper.release_thread()
+            raise
+        return wrapper
+
+    def release_thread(self):
+        if self.browser_pool is not None:
+            self.browser_pool.release(self.thread)
+        else:
+            self.executor.shutdown(wait=False)
+
+    async def areset(self):
+        return await self.run_in_browser_thread(self.env.reset)
+
+    async def aclose(self):
+        try:
+            await self.run_in_browser_thread(self.env.close)
+        finally:
+            self.release_thread()
+
+    async def aobservation(self, query=None):
+        return await self.run_in_browser_thread(self.env.observation, query)
+
+    async def astep(self, action):
+        return await self.run_in_browser_thread(self.env.step, action)
+
+    def get_url(self):
+        return self.env.get_url()
+
+    def get_objective(self):
+        return self.env.get_objective()
+
+    def done(self):
+        return self.env.done()
+
+    def status(self):
+        return self.env.status()
@@ -0,0 +1,170 @@
+import json
+import time
+from pathlib import Path
+
+from lib.environments.page_settle import SettlingScriptBrowserEnv
+from playwright.sync_api import sync_playwright
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+class PooledScriptBrowserEnv(SettlingScriptBrowserEnv):
+    """
+    ScriptBrowserEnv that keeps Playwright and Chromium alive across resets.
+    Every reset only swaps the browser context, so each task still gets a
+    fresh, isolated set of cookies, storage and pages.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.launched = False
+        self.num_tasks = 0
+
+    def launch(self):
+        self.context_manager = sync_playwright()
+        self.playwright = self.context_manager.__enter__()
+        self.browser = self.playwright.chromium.launch(
+            headless=self.headless, slow_mo=self.slow_mo
+        )
+        self.launched = True
+
+    def close_context(self):
+        context = getattr(self, "context", None)
+        if context is not None:
+            try:
+                context.close()
+            except Exception as e:
+                print(f"Error occurred while closing context: {e}")
+            self.context = None
+
+    def setup(self, config_file: Path | None = None) -> None:
+        if not self.launched:
+            self.launch()
+        self.close_context()
+
+        instance_config = {}
+        if config_file:
+            with open(config_file, "r") as f:
+                instance_config = json.load(f)
+
+        self.context = self.browser.new_context(
+            viewport=self.viewport_size,
+            storage_state=instance_config.get("storage_state", None),
+            geolocation=instance_config.get("geolocation", None),
+            device_scale_factor=1,
+        )
+        if self.save_trace_enabled:
+            self.context.tracing.start(screenshots=True, snapshots=True)
+
+        start_url = instance_config.get("start_url", None)
+        start_urls = start_url.split(" |AND| ") if start_url else [None]
+        for url in start_urls:
+            page = self.context.new_page()
+            client = page.context.new_cdp_session(page)
+            if self.text_observation_type == "accessibility_tree":
+                client.send("Accessibility.enable")
+            page.client = client  # type: ignore
+            if url:
+                page.goto(url)
+        self.page = self.context.pages[0]
+        self.page.bring_to_front()
+
+    def reset(self, *, seed=None, options=None):
+        # The parent tears down Playwright when a previous reset finished,
+        # we only want it to rebuild the context through setup().
+        self.reset_finished = False
+        self.num_tasks += 1
+        return super().reset(seed=seed, options=options)
+
+    def close(self):
+        self.close_context()
+        if self.launched:
+            self.browser.close()
+            self.context_manager.__exit__()
+            self.launched = False
+
+
+class BrowserPool:
+    """
+    Per-process pool of warm browsers.
+    Browsers are recycled after max_tasks_per_browser tasks or when the
+    process tree grows above max_memory_mb (needs psutil).
+    """
+
+    def __init__(self, max_tasks_per_browser=20, max_memory_mb=None):
+        self.max_tasks_per_browser = max_tasks_per_browser
+        self.max_memory_mb = max_memory_mb
+        self.idle = []
+        self.hits = 0
+        self.misses = 0
+        self.recycled = 0
+        self.reset_latencies = []
+
+    @staticmethod
+    def env_key(env_kwargs):
+        return json.dumps(env_kwargs, sort_keys=True)
+
+    def acquire(self, **env_kwargs):
+        key = self.env_key(env_kwargs)
+        for i, (idle_key, env) in enumerate(self.idle):
+            if idle_key == key:
+                self.hits += 1
+                self.idle.pop(i)
+                return env, True
+        self.misses += 1
+        return PooledScriptBrowserEnv(**env_kwargs), False
+
+    def reset(self, env, config_file):
+        start = time.perf_counter()
+        obs, info = env.reset(options={"config_file": config_file})
+        latency = time.perf_counter() - start
+        self.reset_latencies.append(latency)
+        return obs, info, latency
+
+    def memory_mb(self):
+        if psutil is None:
+            return None
+        process = psutil.Process()
+        total = process.memory_info().rss
+        for child in process.children(recursive=True):
+            try:
+                total += child.memory_info().rss
+            except psutil.Error:
+                continue
+        return total / (1024 * 1024)
+
+    def should_recycle(self, env):
+        if env.num_tasks >= self.max_tasks_per_browser:
+            return True
+        if self.max_memory_mb is not None:
+            memory_mb = self.memory_mb()
+            if memory_mb is not None and memory_mb > self.max_memory_mb:
+                return True
+        return False
+
+    def release(self, env, **env_kwargs):
+        if self.should_recycle(env):
+            self.recycled += 1
+            env.close()
+            return
+        env.close_context()
+        self.idle.append((self.env_key(env_kwargs), env))
+
+    def close(self):
+        for _, env in self.idle:
+            env.close()
+        self.idle = []
+
+    def stats(self):
+        latencies = self.reset_latencies
+        return {
+            "pool_hits": self.hits,
+            "pool_misses": self.misses,
+            "pool_recycled": self.recycled,
+            "pool_mean_reset_latency": (
+                sum(latencies) / len(latencies) if latencies else 0.0
+            ),
+        }
@@ -0,0 +1,145 @@
+import math
+import re
+from bisect import bisect_right
+from collections import Counter
+from itertools import accumulate
+
+from lib.utils.tokens import estimate_tokens
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+INTERACTIVE_PATTERN = re.compile(
+    r"\[\d+\] (?:button|textbox|searchbox|combobox|checkbox|option|menuitem)\b"
+)
+# Smallest budget left that could still fit a node
+MIN_NODE_TOKENS = 8
+STOPWORDS = {
+    "a", "an", "and", "are", "at", "be", "by", "can", "for", "from", "i", "in",
+    "is", "it", "me", "my", "of", "on", "or", "the", "to", "what", "with",
+}  # fmt: skip
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class ObservationPruner:
+    """
+    Keeps the accessibility tree nodes most relevant to a query within a
+    token budget. Nodes are ranked with a BM25 index built over the page,
+    matching interactive elements get a small prior, and the ancestors of
+    every kept node are kept as well so the tree structure stays readable.
+
+    Each query term is located with str.find over the whole page, only the
+    matching nodes are scored, and parents are looked up with str.rfind for
+    the nodes that are kept. Pruning a 5k node tree takes a few milliseconds,
+    most of it spent per hit of a query term.
+    """
+
+    def __init__(self, max_tokens=2000, k1=1.2, b=0.75, interactive_prior=0.5):
+        self.max_tokens = max_tokens
+        self.k1 = k1
+        self.b = b
+        self.interactive_prior = interactive_prior
+
+    @staticmethod
+    def term_counts(text, offsets, terms):
+        """
+        Per term, a Counter of the node indices of its whole word hits.
+        """
+        counts = {}
+        length = len(text)
+        for term in terms:
+            size = len(term)
+            indices = []
+            position = text.find(term)
+            while position != -1:
+                end = position + size
+                if (position == 0 or not text[position - 1].isalnum()) and (
+                    end == length or not text[end].isalnum()
+                ):
+                    indices.append(bisect_right(offsets, position) - 1)
+                position = text.find(term, end)
+            if indices:
+                counts[term] = Counter(indices)
+        return counts
+
+    def score(self, text, lines, depths, offsets, query):
+        terms = set(tokenize(query)) - STOPWORDS
+        counts = self.term_counts(text.lower(), offsets, terms)
+
+        k1, b = self.k1, self.b
+        num_docs = len(lines)
+        avg_len = len(text) / num_docs
+        scores = {}
+        for term, term_counts in counts.items():
+            df = len(term_counts)
+            idf = math.log(1 + (num_docs - df + 0.5) / (df + 0.5))
+            for index, tf in term_counts.items():
+                norm = k1 * (1 - b + b * len(lines[index]) / avg_len)
+                score = idf * tf * (k1 + 1) / (tf + norm)
+                scores[index] = scores.get(index, 0.0) + score
+
+        for index in scores:
+            # The role follows the id at the start of the line
+            if INTERACTIVE_PATTERN.match(lines[index], ord(depths[index])):
+                scores[index] += self.interactive_prior
+        return scores
+
+    @staticmethod
+    def parent(depths, index):
+        """
+        Closest previous line with a smaller indentation. depths holds the
+        indentation of every line as one character, so each level is one
+        str.rfind, the deepest first, and the shallower levels are only
+        searched between the closest match so far and the line.
+        """
+        found = -1
+        for level in range(ord(depths[index]) - 1, -1, -1):
+            position = depths.rfind(chr(level), found + 1, index)
+            if position != -1:
+                found = position
+        return found if found != -1 else None
+
+    def prune(self, text, query):
+        if estimate_tokens(text) <= self.max_tokens:
+            return text
+        lines = [line for line in text.split("\n") if line]
+        text = "\n".join(lines)
+        offsets = [0] + list(accumulate(len(line) + 1 for line in lines))[:-1]
+        depths = "".join([chr(len(line) - len(line.lstrip("\t"))) for line in lines])
+
+        def chain_of(index):
+            # The node and its ancestors that are not kept yet, with their cost
+            chain = [index]
+            cost = len(lines[index]) // 4 + 1
+            parent = self.parent(depths, index)
+            while parent is not None and parent not in keep:
+                chain.append(parent)
+                cost += len(lines[parent]) // 4 + 1
+                parent = self.parent(depths, parent)
+            return chain, cost
+
+        # Relevant nodes by score first, then fill the rest of the budget with
+        # the page in document order until the next node does not fit.
+        scores = self.score(text, lines, depths, offsets, query)
+        keep = set()
+        budget = self.max_tokens
+        # Stable sort of the ascending indices: ties stay in document order
+        for index in sorted(sorted(scores), key=scores.__getitem__, reverse=True):
+            if index in keep:
+                continue
+            chain, cost = chain_of(index)
+            if cost <= budget:
+                keep.update(chain)
+                budget -= cost
+            if budget < MIN_NODE_TOKENS:
+                break
+        for index in range(len(lines)):
+            if index in keep:
+                continue
+            chain, cost = chain_of(index)
+            if cost > budget:
+                break
+            keep.update(chain)
+            budget -= cost
+        return "\n".join(lines[i] for i in sorted(keep))
@@ -0,0 +1,161 @@
+import time
+
+from browser_env import ActionTypes, ScriptBrowserEnv
+from lib.utils.tracing import span
+
+# Installs a MutationObserver on first use and reports how long the DOM has
+# been quiet.
+SETTLE_STATE_JS = """() => {
+    if (!window.__settleState) {
+        window.__settleState = {last: performance.now()};
+        new MutationObserver(() => { window.__settleState.last = performance.now(); })
+            .observe(document, {subtree: true, childList: true, attributes: true, characterData: true});
+    }
+    return {
+        quiet: performance.now() - window.__settleState.last,
+        ready: document.readyState,
+    };
+}"""
+
+# Map tiles and fonts keep loading long after the accessibility tree is final
+IGNORED_RESOURCE_TYPES = {"image", "media", "font", "websocket", "eventsource"}
+
+
+def tree_fingerprint(client):
+    """
+    Fingerprint of the accessibility tree the observation is built from, the
+    roles and names of its nodes as reported over CDP.
+    """
+    nodes = client.send("Accessibility.getFullAXTree", {})["nodes"]
+    return hash(
+        tuple(
+            (node.get("role", {}).get("value"), node.get("name", {}).get("value"))
+            for node in nodes
+            if not node.get("ignored")
+        )
+    )
+
+
+class PageSettleDetector:
+    """
+    Waits until a page is quiet instead of sleeping for a fixed time.
+    A page is settled once the document is loaded, no relevant requests are
+    in flight, the DOM has not mutated for quiet_ms, and the accessibility
+    tree did not change between two polls, or when timeout_ms is hit. The
+    tree is only fetched once the cheaper signals say the page is quiet.
+    """
+
+    def __init__(self, quiet_ms=150, poll_ms=50, timeout_ms=5000):
+        self.quiet_ms = quiet_ms
+        self.poll_ms = poll_ms
+        self.timeout_ms = timeout_ms
+        self.inflight = {}
+        self.clients = {}
+        self.settle_times = []
+        self.timeouts = 0
+
+    def reset(self):
+        self.inflight = {}
+        self.clients = {}
+
+    def client(self, page):
+        # webarena keeps a CDP session with the accessibility domain on the page
+        client = getattr(page, "client", None)
+        if client is None:
+            key = id(page)
+            if key not in self.clients:
+                self.clients[key] = page.context.new_cdp_session(page)
+            client = self.clients[key]
+        return client
+
+    def attach(self, page):
+        key = id(page)
+        if key in self.inflight:
+            return
+        self.inflight[key] = 0
+
+        def started(request):
+            if request.resource_type not in IGNORED_RESOURCE_TYPES:
+                self.inflight[key] += 1
+
+        def finished(request):
+            if request.resource_type not in IGNORED_RESOURCE_TYPES:
+                self.inflight[key] = max(self.inflight[key] - 1, 0)
+
+        page.on("request", started)
+        page.on("requestfinished", finished)
+        page.on("requestfailed", finished)
+
+    def wait(self, page):
+        self.attach(page)
+        start = time.perf_counter()
+        previous_fingerprint = None
+        while True:
+            if (time.perf_counter() - start) * 1000 >= self.timeout_ms:
+                self.timeouts += 1
+                break
+            try:
+                state = page.evaluate(SETTLE_STATE_JS)
+            except Exception:
+                # The execution context is replaced while navigating
+                state = None
+            fingerprint = None
+            if (
+                state is not None
+                and state["ready"] == "complete"
+                and self.inflight[id(page)] == 0
+                and state["quiet"] >= self.quiet_ms
+            ):
+                try:
+                    fingerprint = tree_fingerprint(self.client(page))
+                except Exception:
+                    fingerprint = None
+                if fingerprint is not None and fingerprint == previous_fingerprint:
+                    break
+            previous_fingerprint = fingerprint
+            # Unlike time.sleep this lets Playwright dispatch request events
+            page.wait_for_timeout(self.poll_ms)
+
+        settle_time = time.perf_counter() - start
+        self.settle_times.append(settle_time)
+        return settle_time
+
+    def stats(self):
+        settle_times = self.settle_times
+        return {
+            "mean_settle_time": (
+                sum(settle_times) / len(settle_times) if settle_times else 0.0
+            ),
+            "settle_timeouts": self.timeouts,
+        }
+
+
+class SettlingScriptBrowserEnv(ScriptBrowserEnv):
+    """
+    ScriptBrowserEnv that waits for the page to settle after executing an
+    action and before capturing its observation, with the settle_detector
+    set by the environment wrapper. ScriptBrowserEnv.step() captures the
+    observation through _get_obs(), so that is where the wait goes.
+    """
+
+    settle_detector = None
+    settle_pending = False
+    last_settle_time = None
+
+    def step(self, action):
+        self.last_settle_time = None
+        self.settle_pending = (
+            self.settle_detector is not None
+            and action["action_type"] != ActionTypes.STOP
+        )
+        try:
+            return super().step(action)
+        finally:
+            self.settle_pending = False
+
+    def _get_obs(self):
+        if self.settle_pending:
+            self.settle_pending = False
+            with span("settle"):
+                self.last_settle_time = self.settle_detector.wait(self.page)
+        return super()._get_obs()
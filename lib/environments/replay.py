@@ -0,0 +1,119 @@
+import hashlib
+from collections import defaultdict, deque
+
+from dsp.modules.lm import LM
+
+
+def prompt_hash(prompt):
+    return hashlib.sha256(str(prompt).encode("utf-8")).hexdigest()
+
+
+class ReplayLM(LM):
+    """
+    Serves the completions recorded for a task. Requests are matched by
+    prompt; when a prompt was not recorded (e.g. prompt construction changed)
+    the next unused completion is returned and the mismatch is counted.
+    """
+
+    def __init__(self, events):
+        lm_events = [event for event in events if event["type"] == "lm"]
+        super().__init__(model=lm_events[0]["model"] if lm_events else "replay")
+        self.provider = "replay"
+        self.by_prompt = defaultdict(deque)
+        self.sequence = deque()
+        for index, event in enumerate(lm_events):
+            self.by_prompt[prompt_hash(event["prompt"])].append(index)
+            self.sequence.append(index)
+        self.lm_events = lm_events
+        self.used = set()
+        self.calls = 0
+        self.prompt_mismatches = 0
+
+    def basic_request(self, prompt, **kwargs):
+        queue = self.by_prompt.get(prompt_hash(prompt))
+        while queue and queue[0] in self.used:
+            queue.popleft()
+        if queue:
+            index = queue.popleft()
+        else:
+            self.prompt_mismatches += 1
+            while self.sequence and self.sequence[0] in self.used:
+                self.sequence.popleft()
+            if not self.sequence:
+                raise RuntimeError("Replay ran out of recorded LM responses")
+            index = self.sequence.popleft()
+        self.used.add(index)
+        self.calls += 1
+        completions = self.lm_events[index]["completions"]
+        self.history.append(
+            {"prompt": prompt, "response": completions, "kwargs": kwargs}
+        )
+        return completions
+
+    def __call__(self, prompt, only_completed=True, return_sorted=False, **kwargs):
+        return self.basic_request(prompt, **kwargs)
+
+    def copy(self, **kwargs):
+        # Replays share their recorded responses
+        return self
+
+    def inspect_history(self, n=1, skip=0):
+        for entry in self.history[-n:]:
+            print(entry["prompt"])
+            print(entry["response"])
+
+
+class ReplayEnvironment:
+    """
+    Stands in for WebArenaEnvironmentWrapper by serving the recorded
+    observations and statuses, and counts actions that differ from the
+    recorded ones.
+    """
+
+    def __init__(self, events):
+        task = next((event for event in events if event["type"] == "task"), {})
+        self.objective = task.get("objective", "")
+        self.observations = [
+            event for event in events if event["type"] == "observation"
+        ]
+        self.recorded_steps = [event for event in events if event["type"] == "step"]
+        self.steps = 0
+        self.action_mismatches = 0
+        self.url = self.observations[0]["url"] if self.observations else None
+        self.last_status = {}
+
+    def get_objective(self):
+        return self.objective
+
+    def get_url(self):
+        return self.url
+
+    def observation(self, query=None):
+        if not self.observations:
+            return ""
+        event = self.observations[min(self.steps, len(self.observations) - 1)]
+        self.url = event["url"]
+        return event["observation"]
+
+    def done(self):
+        if self.steps >= len(self.recorded_steps):
+            return True
+        return bool(self.last_status.get("done", False))
+
+    def step(self, action):
+        recorded = self.recorded_steps[self.steps]
+        if action != recorded["action"]:
+            self.action_mismatches += 1
+        self.steps += 1
+        self.last_status = recorded["status"]
+        return self.status()
+
+    def status(self):
+        return {
+            **self.last_status,
+            "replay_steps": self.steps,
+            "replay_action_mismatches": self.action_mismatches,
+        }
+
+    def close(self):
+        pass
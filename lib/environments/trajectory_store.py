@@ -0,0 +1,147 @@
+import os
+import pickle
+import tempfile
+import threading
+from collections.abc import Sequence
+
+
+def estimate_size(value, depth=0) -> int:
+    """
+    Rough size in bytes of an observation or info dict, counting strings,
+    bytes and arrays, which make up nearly all of it.
+    """
+    if depth > 8:
+        return 0
+    if isinstance(value, (str, bytes, bytearray)):
+        return len(value)
+    if hasattr(value, "nbytes"):  # numpy arrays
+        return int(value.nbytes)
+    if isinstance(value, dict):
+        return sum(estimate_size(v, depth + 1) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(estimate_size(v, depth + 1) for v in value)
+    if hasattr(value, "__dict__"):
+        return estimate_size(vars(value), depth + 1)
+    return 8
+
+
+class SpilledState:
+    """Placeholder for a state written to the spill file."""
+
+    def __init__(self, offset, length):
+        self.offset = offset
+        self.length = length
+
+
+class TrajectoryStore(Sequence):
+    """
+    Sequence of actions and states used as the webarena Trajectory. The
+    evaluators only read the last action (its answer), so actions stay in
+    memory while states (observation text and images, page content) are
+    pickled to a spill file once they are no longer the latest state, or as
+    soon as the states in memory exceed max_memory_mb. Spilled states are
+    loaded back transparently when indexed, the evaluators get
+    evaluation_trajectory() which leaves them on disk.
+    """
+
+    def __init__(self, max_memory_mb=16, spill_dir=None):
+        self.max_memory_bytes = int(max_memory_mb * 1024 * 1024)
+        self.spill_dir = spill_dir
+        self.items = []
+        self.sizes = {}  # index -> size of the states kept in memory
+        self.memory_bytes = 0
+        self.peak_memory_bytes = 0
+        self.spilled_bytes = 0
+        self.spill_file = None
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def is_state(item):
+        return isinstance(item, dict) and "observation" in item
+
+    def append(self, item):
+        with self.lock:
+            if self.is_state(item):
+                # Only the latest state is kept in memory
+                for index in list(self.sizes):
+                    self.spill(index)
+                size = estimate_size(item)
+                self.items.append(item)
+                self.sizes[len(self.items) - 1] = size
+                self.memory_bytes += size
+                self.peak_memory_bytes = max(self.peak_memory_bytes, self.memory_bytes)
+                if self.memory_bytes > self.max_memory_bytes:
+                    self.spill(len(self.items) - 1)
+            else:
+                self.items.append(item)
+
+    def spill(self, index):
+        try:
+            data = pickle.dumps(self.items[index], protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            # Unpicklable states stay in memory
+            return
+        if self.spill_file is None:
+            self.spill_file = tempfile.TemporaryFile(
+                prefix="trajectory_", dir=self.spill_dir
+            )
+        self.spill_file.seek(0, os.SEEK_END)
+        offset = self.spill_file.tell()
+        self.spill_file.write(data)
+        self.items[index] = SpilledState(offset, len(data))
+        self.memory_bytes -= self.sizes.pop(index)
+        self.spilled_bytes += len(data)
+
+    def load(self, item):
+        if not isinstance(item, SpilledState):
+            return item
+        with self.lock:
+            self.spill_file.seek(item.offset)
+            return pickle.loads(self.spill_file.read(item.length))
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.load(item) for item in self.items[index]]
+        return self.load(self.items[index])
+
+    def materialize(self):
+        """
+        The trajectory as a plain list with every spilled state loaded back,
+        for the webarena evaluators which are type checked against a list.
+        """
+        return self[:]
+
+    def evaluation_trajectory(self):
+        """
+        The trajectory as a plain list for the webarena evaluators, which are
+        type checked against a list but only read the actions and the live
+        page. Spilled states are replaced by empty states instead of being
+        loaded back.
+        """
+        return [
+            {"observation": {}, "info": {"spilled": True}}
+            if isinstance(item, SpilledState)
+            else item
+            for item in self.items
+        ]
+
+    def actions(self):
+        return [
+            item
+            for item in self.items
+            if not isinstance(item, SpilledState) and not self.is_state(item)
+        ]
+
+    def stats(self):
+        return {
+            "trajectory_peak_memory_bytes": self.peak_memory_bytes,
+            "trajectory_spilled_bytes": self.spilled_bytes,
+        }
+
+    def close(self):
+        if self.spill_file is not None:
+            self.spill_file.close()
+            self.spill_file = None
@@ -1,5 +1,6 @@
 import json
-import re
+import os
+import tempfile
 
 # Init an environment
 from browser_env import (
@@ -8,9 +9,14 @@ from browser_env import (
     StateInfo,
     Trajectory,
     ActionTypes,
-    ScriptBrowserEnv,
 )
 from evaluation_harness.evaluators import evaluator_router
+from lib.environments.observation_pruning import ObservationPruner
+from lib.environments.page_settle import PageSettleDetector, SettlingScriptBrowserEnv
+from lib.environments.trajectory_store import TrajectoryStore
+from lib.modules.action_parser import ParsedAction, parse_action
+from lib.utils.accessibility_tree import element_ids
+from lib.utils.tracing import span, traced
 
 
 class WebArenaEnvironmentWrapper:
@@ -24,54 +30,177 @@ class WebArenaEnvironmentWrapper:
         current_viewport_only=False,
         viewport_size={"width": 1280, "height": 720},
         headless=False,
+        browser_pool=None,
+        max_observation_tokens=None,
+        adaptive_settle=False,
+        trajectory_memory_mb=16,
     ):
-        self.webarena_env = ScriptBrowserEnv(
+        self.browser_pool = browser_pool
+        self.env_kwargs = dict(
             headless=headless,
-            slow_mo=slow_mo,
+            # The settle wait replaces the fixed delay on every browser call
+            slow_mo=0 if adaptive_settle else slow_mo,
             observation_type=observation_type,
             current_viewport_only=current_viewport_only,
             viewport_size=viewport_size,
         )
+        # Everything else a copy of this environment needs, e.g. search branches
+        self.wrapper_kwargs = dict(
+            max_browser_rows=max_browser_rows,
+            max_steps=max_steps,
+            max_observation_tokens=max_observation_tokens,
+            adaptive_settle=adaptive_settle,
+            trajectory_memory_mb=trajectory_memory_mb,
+        )
+        self.pool_hit = False
+        self.reset_latency = 0.0
+        self.settle_detector = PageSettleDetector() if adaptive_settle else None
+        self.observation_pruner = (
+            ObservationPruner(max_tokens=max_observation_tokens)
+            if max_observation_tokens
+            else None
+        )
+        if self.browser_pool is not None:
+            self.webarena_env, self.pool_hit = self.browser_pool.acquire(
+                **self.env_kwargs
+            )
+        else:
+            self.webarena_env = SettlingScriptBrowserEnv(**self.env_kwargs)
+        # Pooled browsers are shared, each wrapper sets its own detector
+        self.webarena_env.settle_detector = self.settle_detector
+        self.element_ids_text = None
+        self.element_ids = set()
         self.config_file = config_file
         with open(self.config_file, "r") as f:
             self.config = json.load(f)
 
-        self.obs, self.info = self.webarena_env.reset(
-            options={"config_file": self.config_file}
-        )
-        self.terminated = False
+        self.reset()
         self.objective = self.config["intent"]
         self.url = self.config["start_url"]
         self.max_browser_rows = max_browser_rows
         self.max_steps = max_steps
+        self.trajectory_memory_mb = trajectory_memory_mb
+        self.trajectory = None
+        self.new_episode()
+        self.update_webarena_metrics()
+
+    def new_episode(self):
+        """
+        Resets the per-episode counters and the trajectory, for a new task or
+        a restored snapshot.
+        """
+        self.terminated = False
         self.steps = 0
         self.is_done = False
         self.reward = 0.0
         self.action_limit_exceeded = False
-
-        self.trajectory: Trajectory = []
-        self.update_webarena_metrics()
+        self.invalid_actions = 0
+        self.action_error = None
+        if self.trajectory is not None:
+            self.trajectory.close()
+        # Only the last action and state are kept in memory, older states are
+        # spilled to disk until the evaluator runs
+        self.trajectory: Trajectory = TrajectoryStore(  # type: ignore
+            max_memory_mb=self.trajectory_memory_mb
+        )
 
     def reset(self):
-        self.obs, self.info = self.webarena_env.reset(
-            options={"config_file": self.config_file}
-        )
+        if self.settle_detector is not None:
+            self.settle_detector.reset()
+        if self.browser_pool is not None:
+            self.obs, self.info, self.reset_latency = self.browser_pool.reset(
+                self.webarena_env, self.config_file
+            )
+        else:
+            self.obs, self.info = self.webarena_env.reset(
+                options={"config_file": self.config_file}
+            )
 
     def close(self):
-        self.webarena_env.close()
+        self.trajectory.close()
+        if self.browser_pool is not None:
+            self.browser_pool.release(self.webarena_env, **self.env_kwargs)
+        else:
+            self.webarena_env.close()
 
     def get_url(self):
         return self.url
 
+    def snapshot(self):
+        """
+        Captures the browser state as storage state (cookies, local storage)
+        plus the current URL. Unsubmitted form input is not part of it.
+        """
+        return {
+            "url": self.webarena_env.page.url,
+            "storage_state": self.webarena_env.context.storage_state(),
+        }
+
+    def restore(self, snapshot):
+        """
+        Loads a snapshot as a new episode: the step counters and the trajectory
+        start over from the restored page.
+        """
+        config = {
+            **self.config,
+            "storage_state": snapshot["storage_state"],
+            "start_url": snapshot["url"],
+        }
+        fd, config_file = tempfile.mkstemp(suffix=".json")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(config, f)
+            self.obs, self.info = self.webarena_env.reset(
+                options={"config_file": config_file}
+            )
+        finally:
+            os.remove(config_file)
+        self.url = snapshot["url"]
+        if self.settle_detector is not None:
+            self.settle_detector.reset()
+        self.new_episode()
+        self.update_webarena_metrics()
+
+    def checkpoint(self):
+        """
+        The snapshot plus the step counters and the actions taken so far.
+        Past states are left out, the evaluators only look at the last action
+        and the live page.
+        """
+        return {
+            **self.snapshot(),
+            "steps": self.steps,
+            "invalid_actions": self.invalid_actions,
+            "actions": self.trajectory.actions(),
+        }
+
+    def restore_checkpoint(self, checkpoint):
+        self.restore(checkpoint)
+        self.steps = checkpoint["steps"]
+        self.invalid_actions = checkpoint["invalid_actions"]
+        self.trajectory.close()
+        self.trajectory = TrajectoryStore(  # type: ignore
+            max_memory_mb=self.trajectory_memory_mb
+        )
+        for action_cmd in checkpoint["actions"]:
+            # Placeholders keep states and actions alternating
+            self.trajectory.append({"observation": {}, "info": {"checkpoint": True}})
+            self.trajectory.append(action_cmd)
+        self.update_webarena_metrics()
+
     def get_objective(self):
         return self.objective
 
-    def observation(self):
+    @traced("observation")
+    def observation(self, query=None):
         self.obs = self.webarena_env._get_obs()
         self.url = self.webarena_env.page.url
         browser_content = self.obs["text"]
-        browser_content = browser_content.split("\n")[: self.max_browser_rows]  # type: ignore
-        browser_content = "\n".join(browser_content)
+        if self.observation_pruner is not None and query:
+            browser_content = self.observation_pruner.prune(browser_content, query)
+        else:
+            browser_content = browser_content.split("\n")[: self.max_browser_rows]  # type: ignore
+            browser_content = "\n".join(browser_content)
         return browser_content
 
     def done(self):
@@ -86,8 +215,15 @@ class WebArenaEnvironmentWrapper:
             "success": float(self.reward > 0),
             "num_actions": self.steps,
             "action_limit_exceeded": self.action_limit_exceeded,
+            "invalid_actions": self.invalid_actions,
+            "action_error": self.action_error,
+            "pool_hit": self.pool_hit,
+            "reset_latency": self.reset_latency,
+            **(self.settle_detector.stats() if self.settle_detector else {}),
+            **self.trajectory.stats(),
         }
 
+    @traced("env_step")
     def step(self, action):
         self.steps = self.steps + 1
         print(f"[Step {self.steps}] {action}")
@@ -102,19 +238,23 @@ class WebArenaEnvironmentWrapper:
             self.update_webarena_metrics(action_cmd)
             return self.status()
 
-        if "stop [" in action:
-            action = action.replace("\\", "")
-
-        if action is None or action is "" or ("note [" in action):
-            action_cmd = None
-        else:
-            action_cmd = self.call_right_action(action)
+        self.action_error = self.validate_action(action)
+        if self.action_error is not None:
+            # Rejected without touching the browser
+            self.invalid_actions += 1
+            print(f"[Invalid action] {self.action_error}")
+            return self.status()
 
+        action_cmd = self.call_right_action(action)
         if action_cmd:
             try:
-                self.obs, _, self.terminated, _, self.info = self.webarena_env.step(
-                    action_cmd
-                )
+                with span("browser_step"):
+                    # Settles the page before the observation is captured
+                    self.obs, _, self.terminated, _, self.info = (
+                        self.webarena_env.step(action_cmd)
+                    )
+                if self.webarena_env.last_settle_time is not None:
+                    print(f"[Settle] {self.webarena_env.last_settle_time:.3f}s")
                 self.update_webarena_metrics(action_cmd)
             except Exception as e:
                 print(f"Error occurred while taking step: {e}")
@@ -123,6 +263,7 @@ class WebArenaEnvironmentWrapper:
 
         return self.status()
 
+    @traced("update_metrics")
     def update_webarena_metrics(self, action_cmd=None):
         # Append action (if any) and resulting sate
         if action_cmd:
@@ -136,28 +277,49 @@ class WebArenaEnvironmentWrapper:
 
         if self.is_done:
             try:
-                evaluator = evaluator_router(self.config_file)
-                self.reward = evaluator(
-                    trajectory=self.trajectory,
-                    config_file=self.config_file,
-                    page=self.webarena_env.page,
-                    client=self.webarena_env.get_page_client(self.webarena_env.page),
-                )
+                with span("evaluator"):
+                    evaluator = evaluator_router(self.config_file)
+                    self.reward = evaluator(
+                        trajectory=self.trajectory.evaluation_trajectory(),
+                        config_file=self.config_file,
+                        page=self.webarena_env.page,
+                        client=self.webarena_env.get_page_client(
+                            self.webarena_env.page
+                        ),
+                    )
             except Exception as e:
                 print(f"Got excepetion: {e}")
                 self.reward = 0
 
-    def call_right_action(self, action_str):
-        if "select" in action_str:
-            pattern = r"select \[(\d+)\] \[(.+)\]"
-            match = re.search(pattern, action_str)
-            if match:
-                option = match.group(2)
-                output_string = (
-                    f'page.get_by_role("combobox").select_option("{option}")'
-                )
-                return create_playwright_action(output_string)
-            else:
-                return create_id_based_action(action_str)
-        else:
-            return create_id_based_action(action_str)
+    def validate_action(self, action):
+        """
+        Returns why the action can not be dispatched, or None. Element ids have
+        to be present in the current accessibility tree.
+        """
+        parsed = parse_action(action)
+        if parsed is None:
+            return f"Unparseable action: {action}"
+        if parsed.is_module:
+            return f"Subroutine {parsed.name} is not a browser action"
+        element_id = parsed.element_id
+        if element_id is not None and element_id not in self.current_element_ids():
+            return f"Element [{element_id}] is not on the page: {parsed}"
+        return None
+
+    def current_element_ids(self):
+        text = self.obs["text"]
+        if self.element_ids_text is not text:
+            self.element_ids_text = text
+            self.element_ids = element_ids(text)
+        return self.element_ids
+
+    def call_right_action(self, action):
+        action = parse_action(action)
+        if action.is_stop:  # type: ignore
+            answer = action.answer.replace("\\", "")  # type: ignore
+            return create_id_based_action(str(ParsedAction("stop", (answer,))))
+        if action.name == "select":  # type: ignore
+            option = action.args[1]  # type: ignore
+            output_string = f'page.get_by_role("combobox").select_option("{option}")'
+            return create_playwright_action(output_string)
+        return create_id_based_action(str(action))
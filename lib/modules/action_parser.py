@@ -0,0 +1,188 @@
+import re
+import threading
+from dataclasses import dataclass
+from typing import Literal, Optional, Tuple
+
+from lib.modules.data_models import Action, ModuleAction
+from lib.modules.subroutines import subroutine_names
+
+ARG_PATTERN = re.compile(r"\[(.*?)\]")
+ID_ARGS = {"id", "tab_index"}
+PREFIX_PATTERN = re.compile(r"^\s*(next[_ ]action|action)\s*[:=]\s*", re.IGNORECASE)
+
+
+@dataclass(frozen=True)
+class ParsedAction:
+    """
+    Typed form of an action string, e.g. ParsedAction("type", ("7", "Zoe", "1")).
+    str() gives back the canonical action string.
+    """
+
+    name: str
+    args: Tuple[str, ...] = ()
+
+    def __str__(self) -> str:
+        return " ".join([self.name] + [f"[{arg}]" for arg in self.args])
+
+    @property
+    def element_id(self) -> Optional[str]:
+        if self.name in ELEMENT_ACTIONS and self.args:
+            return self.args[0]
+        return None
+
+    @property
+    def is_stop(self) -> bool:
+        return self.name == "stop"
+
+    @property
+    def is_module(self) -> bool:
+        return self.name in MODULE_ACTIONS or self.name in subroutine_names(
+            callable_only=True
+        )
+
+    @property
+    def answer(self) -> str:
+        # The answer of stop, or the query of a module action
+        return self.args[0] if self.args else ""
+
+
+def action_name(template: str) -> str:
+    return template.split(" ", 1)[0]
+
+
+ELEMENT_ACTIONS = {
+    action_name(action.value)
+    for action in Action
+    if ARG_PATTERN.findall(action.value)[:1] == ["id"]
+}
+MODULE_ACTIONS = {action_name(action.value) for action in ModuleAction}
+
+
+class ActionGrammar:
+    """
+    Deterministic parser for the actions allowed by a module, generated from
+    the Action/ModuleAction templates, e.g. "type [id] [content] [press_enter_after=0|1]".
+    repair() extracts the first valid action from a slightly malformed LM
+    output (extra prose, code fences, quoted ids, missing brackets) and returns
+    it in canonical form, or None when nothing valid can be recovered.
+    """
+
+    def __init__(self, action_literal):
+        self.templates = {}
+        for template in action_literal.__args__:
+            name = template.split(" ", 1)[0]
+            self.templates[name] = ARG_PATTERN.findall(template)
+        names = sorted(self.templates, key=len, reverse=True)
+        self.name_pattern = re.compile(
+            r"(?<![\w])(" + "|".join(map(re.escape, names)) + r")(?![\w])"
+        )
+
+    def arg_pattern(self, arg, last):
+        if arg in ID_ARGS:
+            return r"\s*\[?\s*['\"]?(\d+)['\"]?\s*\]?"
+        if "=" in arg:
+            choices = arg.split("=", 1)[1].split("|")
+            name = re.escape(arg.split("=", 1)[0])
+            alternatives = "|".join(map(re.escape, choices))
+            pattern = rf"\s*\[?\s*(?:{name}\s*=\s*)?({alternatives})\s*\]?"
+            # Flags such as press_enter_after are optional
+            return f"(?:{pattern})?" if last and arg.startswith("press_") else pattern
+        if last:
+            return r"\s*\[(.*)\]|\s*\[(.*)$"
+        return r"\s*\[(.*?)\]"
+
+    def parse_args(self, name, rest):
+        values = []
+        args = self.templates[name]
+        for i, arg in enumerate(args):
+            pattern = re.compile(self.arg_pattern(arg, last=i == len(args) - 1))
+            match = pattern.match(rest)
+            if match is None:
+                return None
+            value = next((g for g in match.groups() if g is not None), None)
+            if value is None:
+                if arg.startswith("press_"):
+                    break
+                return None
+            values.append(value.strip().strip("'\"").strip())
+            rest = rest[match.end() :]
+        return values
+
+    def parse(self, raw) -> Optional[ParsedAction]:
+        """
+        Parses the first valid action in raw into a ParsedAction, or None.
+        """
+        if not raw:
+            return None
+        text = raw.replace("`", " ").strip()
+        text = PREFIX_PATTERN.sub("", text)
+        for match in self.name_pattern.finditer(text):
+            name = match.group(1)
+            rest = text[match.end() :]
+            values = self.parse_args(name, rest)
+            if name == "stop":
+                # An empty answer is a valid stop, as is a bare "stop" on its own
+                if values:
+                    return ParsedAction(name, tuple(values))
+                if not rest.strip(" .:"):
+                    return ParsedAction(name, ("",))
+                continue
+            if values is None or (self.templates[name] and not values):
+                continue
+            if any(value == "" for value in values):
+                continue
+            return ParsedAction(name, tuple(values))
+        return None
+
+    def repair(self, raw) -> Optional[str]:
+        action = self.parse(raw)
+        return str(action) if action is not None else None
+
+
+class RepairStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stats = {}
+
+    def count(self, module, outcome):
+        with self.lock:
+            counts = self.stats.setdefault(
+                module, {"valid": 0, "retries_avoided": 0, "retries_needed": 0}
+            )
+            counts[outcome] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return {module: dict(counts) for module, counts in self.stats.items()}
+
+
+repair_stats = RepairStats()
+
+_grammars = {}
+
+
+def action_grammar() -> ActionGrammar:
+    """
+    Grammar of every action and callable subroutine, rebuilt when a
+    subroutine is registered.
+    """
+    names = subroutine_names(callable_only=True)
+    if names not in _grammars:
+        templates = [action.value for action in [*Action, *ModuleAction]]
+        templates += [
+            f"{name} [query]"
+            for name in names
+            if not any(t.startswith(f"{name} ") for t in templates)
+        ]
+        _grammars[names] = ActionGrammar(Literal[tuple(templates)])  # type: ignore
+    return _grammars[names]
+
+
+def parse_action(action) -> Optional[ParsedAction]:
+    """
+    Parses an action string with the grammar of every action, the one parser
+    shared by the agents and the environment.
+    """
+    if isinstance(action, ParsedAction):
+        return action
+    return action_grammar().parse(action)
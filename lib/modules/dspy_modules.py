@@ -1,18 +1,9 @@
-from typing import Optional
+import functools
 import dspy
-from pydantic import BaseModel
 from lib.modules.data_models import *
-
-
-class PreviousActionAndState(BaseModel):
-    action: str
-    response: Optional[str] = None
-
-    def __repr__(self) -> str:
-        return f'action="{self.action}", response={self.response}'
-
-    def __str__(self) -> str:
-        return f'action="{self.action}", response={self.response}'
+from lib.modules.history_models import PreviousActionAndState
+from lib.modules.action_parser import ActionGrammar, repair_stats
+from lib.utils.llm_cache import cache_key, get_llm_cache
 
 
 def get_action_description(action_literal) -> str:
@@ -47,8 +38,29 @@ class PredictNextAction(dspy.Signature):
     )
     next_action = dspy.OutputField(
         title="Next Action",
-        desc=f"""One of the following action's to be performed by the web agent to accomplish the objective.
-{get_action_description(AllActions)}""",
+        desc="The action to be performed by the web agent to accomplish the objective.",
+    )
+
+
+@functools.cache
+def signature_with_actions(signature, action_literal):
+    """
+    Subclass of signature whose next_action lists the allowed actions. The
+    descriptions are built on first use rather than when the module is
+    imported, name and instructions are kept.
+    """
+    return type(
+        signature.__name__,
+        (signature,),
+        {
+            "__doc__": signature.__doc__,
+            "__module__": signature.__module__,
+            "next_action": dspy.OutputField(
+                title="Next Action",
+                desc=f"""One of the following action's to be performed by the web agent to accomplish the objective.
+{get_action_description(action_literal)}""",
+            ),
+        },
     )
 
 
@@ -63,12 +75,6 @@ class MapAction(PredictNextAction):
     5. Return exactly as specified in the examples format.
     """
 
-    next_action = dspy.OutputField(
-        title="Next Action",
-        desc=f"""One of the following action's to be performed by the web agent to accomplish the objective.
-{get_action_description(MapActions)}""",
-    )
-
 
 class FindDirectionAction(PredictNextAction):
     """Predict the next action to be performed by the web agent performing tasks on a web browser.
@@ -79,12 +85,6 @@ class FindDirectionAction(PredictNextAction):
     4. Return exactly as specified in the examples format.
     """
 
-    next_action = dspy.OutputField(
-        title="Next Action",
-        desc=f"""One of the following action's to be performed by the web agent to accomplish the objective.
-{get_action_description(FindDirectionActions)}""",
-    )
-
 
 class SearchNearestPlaceAction(PredictNextAction):
     """Predict the next action to be performed by the web agent performing tasks on a web browser.
@@ -103,17 +103,51 @@ class SearchNearestPlaceAction(PredictNextAction):
     7. Return exactly as specified in the examples format.
     """
 
-    next_action = dspy.OutputField(
-        title="Next Action",
-        desc=f"""One of the following action's to be performed by the web agent to accomplish the objective.
-{get_action_description(SearchNearestPlaceActions)}""",
-    )
-
 
 class MapPlanningModule(dspy.Module):
-    def __init__(self):
+    signature = MapAction
+    actions = MapActions
+
+    def __init__(self, max_action_retries: int = 2, signature=None, actions=None):
         super().__init__()
-        self.prog = dspy.TypedPredictor(signature=MapAction, max_retries=5)
+        signature = signature or self.signature
+        actions = actions or self.actions
+        self.prog = dspy.TypedPredictor(
+            signature=signature_with_actions(signature, actions), max_retries=5
+        )
+        self.action_grammar = ActionGrammar(actions)
+        self.max_action_retries = max_action_retries
+
+    def predict(self, attempt: int, **kwargs):
+        # Nudging the temperature on retries bypasses the dspy request cache,
+        # starting from the active LM's own (e.g. a search sample's) temperature
+        config = {}
+        if attempt:
+            lm = dspy.settings.lm
+            temperature = lm.kwargs.get("temperature", 1.0) if lm is not None else 1.0
+            config = {"temperature": temperature + 0.001 * attempt}
+        return self.prog(**kwargs, config=config)
+
+    def predict_valid_action(self, **kwargs):
+        """
+        Repairs the predicted next_action locally with the module's action
+        grammar and only goes back to the LM when nothing valid can be recovered.
+        """
+        module = self.prog.signature.__name__
+        for attempt in range(self.max_action_retries + 1):
+            prediction = self.predict(attempt, **kwargs)
+            raw_action = str(prediction.next_action)
+            action = self.action_grammar.repair(raw_action)
+            if action is None:
+                repair_stats.count(module, "retries_needed")
+                continue
+            if action == raw_action.strip():
+                repair_stats.count(module, "valid")
+            else:
+                repair_stats.count(module, "retries_avoided")
+                prediction.next_action = action
+            return prediction
+        return prediction
 
     def forward(
         self,
@@ -122,23 +156,68 @@ class MapPlanningModule(dspy.Module):
         url: str,
         previous_actions: list[PreviousActionAndState],
     ):
-        return self.prog(
+        cache = get_llm_cache()
+        if cache is not None:
+            lm = dspy.settings.lm
+            key = cache_key(
+                signature=self.prog.signature,
+                objective=objective,
+                observation=observation,
+                url=url,
+                previous_actions=previous_actions,
+                model=lm.kwargs.get("model") if lm is not None else None,
+                temperature=lm.kwargs.get("temperature") if lm is not None else None,
+            )
+            cached = cache.get(key)
+            if cached is not None:
+                return dspy.Prediction(**cached)
+
+        prediction = self.predict_valid_action(
             objective=objective,
             observation=observation,
             url=url,
             previous_actions=previous_actions,
         )
+        if cache is not None:
+            cache.put(key, prediction.toDict())
+        return prediction
 
 
 class FindDirectionModule(MapPlanningModule):
-    def __init__(self):
-        super().__init__()
-        self.prog = dspy.TypedPredictor(signature=FindDirectionAction, max_retries=5)
+    signature = FindDirectionAction
+    actions = FindDirectionActions
 
 
 class SearchNearestPlaceModule(MapPlanningModule):
+    signature = SearchNearestPlaceAction
+    actions = SearchNearestPlaceActions
+
+
+class ScoreStates(dspy.Signature):
+    """Score how close each browser state is to accomplishing the objective.
+    1. Return one score per state, in the same order as the states.
+    2. Scores are between 0.0 (unrelated or stuck) and 1.0 (objective accomplished).
+    3. A state that ends with stop [answer] should be scored by how correct the answer is.
+    """
+
+    objective: str = dspy.InputField(
+        title="Objective",
+        desc="The objective of the task that the web agent is trying to accomplish.",
+    )
+    states: list[str] = dspy.InputField(
+        title="States",
+        desc="Candidate browser states, each with its URL, actions taken and a truncated observation.",
+    )
+    scores: list[float] = dspy.OutputField(
+        title="Scores",
+        desc="One score between 0.0 and 1.0 per state.",
+    )
+
+
+class StateValueModule(dspy.Module):
     def __init__(self):
         super().__init__()
-        self.prog = dspy.TypedPredictor(
-            signature=SearchNearestPlaceAction, max_retries=5
-        )
+        self.prog = dspy.TypedPredictor(signature=ScoreStates, max_retries=3)
+
+    def forward(self, objective: str, states: list[str]):
+        return self.prog(objective=objective, states=states)
@@ -0,0 +1,14 @@
+from typing import Optional
+
+from pydantic import BaseModel
+
+
+class PreviousActionAndState(BaseModel):
+    action: str
+    response: Optional[str] = None
+
+    def __repr__(self) -> str:
+        return f'action="{self.action}", response={self.response}'
+
+    def __str__(self) -> str:
+        return f'action="{self.action}", response={self.response}'
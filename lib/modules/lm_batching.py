@@ -0,0 +1,171 @@
+import json
+import queue
+import threading
+import time
+import urllib.request
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+# Request fields of an OpenAI compatible completions endpoint
+COMPLETION_PARAMS = {
+    "model",
+    "temperature",
+    "max_tokens",
+    "top_p",
+    "n",
+    "stop",
+    "frequency_penalty",
+    "presence_penalty",
+    "seed",
+}
+
+
+class ConcurrentBackend:
+    """
+    Sends every prompt of a batch to the wrapped LM at once with bounded
+    concurrency, one request per prompt. This does not batch on the server,
+    it is the fallback when no completions endpoint is configured, e.g. for
+    chat models.
+    """
+
+    def __init__(self, max_concurrency=16):
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency)
+
+    def __call__(self, lm, prompts, kwargs):
+        futures = [self.executor.submit(lm, prompt, **kwargs) for prompt in prompts]
+        return [future.result() for future in futures]
+
+
+class CompletionsBackend:
+    """
+    Sends a whole batch as one request to an OpenAI compatible completions
+    endpoint, e.g. a vLLM server at http://localhost:8000/v1. The request
+    holds the list of prompts and the answer n choices per prompt, indexed
+    prompt by prompt. Prompts are sent as text, so the server should host a
+    completion model.
+    """
+
+    def __init__(self, base_url, api_key=None, timeout=120):
+        self.url = base_url.rstrip("/") + "/completions"
+        self.api_key = api_key
+        self.timeout = timeout
+
+    def __call__(self, lm, prompts, kwargs):
+        params = {
+            name: value
+            for name, value in {**lm.kwargs, **kwargs}.items()
+            if name in COMPLETION_PARAMS
+        }
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        request = urllib.request.Request(
+            self.url,
+            data=json.dumps({**params, "prompt": prompts}).encode("utf-8"),
+            headers=headers,
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            choices = json.loads(response.read())["choices"]
+        n = params.get("n", 1)
+        completions = [[] for _ in prompts]
+        for choice in sorted(choices, key=lambda choice: choice["index"]):
+            completions[choice["index"] // n].append(choice["text"])
+        return completions
+
+
+class BatchDispatcher:
+    """
+    Collects LM requests from concurrent agents and dispatches them in
+    batches of up to max_batch_size, waiting at most max_wait_ms after the
+    first request of a batch. Requests are only batched with requests for
+    the same LM and generation kwargs. Up to max_in_flight batches are sent at
+    once, the collector keeps forming batches while earlier ones are waiting
+    on the LM.
+    """
+
+    def __init__(
+        self, backend=None, max_wait_ms=20, max_batch_size=16, max_in_flight=4
+    ):
+        self.backend = backend if backend is not None else ConcurrentBackend()
+        self.max_wait_ms = max_wait_ms
+        self.max_batch_size = max_batch_size
+        self.executor = ThreadPoolExecutor(max_workers=max_in_flight)
+        self.requests = queue.Queue()
+        self.lock = threading.Lock()
+        self.queue_delays = []
+        self.batch_sizes = []
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def submit(self, lm, prompt, kwargs):
+        future = Future()
+        self.requests.put((lm, prompt, kwargs, time.perf_counter(), future))
+        return future
+
+    def collect(self):
+        batch = [self.requests.get()]
+        deadline = time.perf_counter() + self.max_wait_ms / 1000
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self.requests.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self):
+        while True:
+            groups = {}
+            for request in self.collect():
+                lm, _, kwargs, _, _ = request
+                key = (id(lm), json.dumps(kwargs, sort_keys=True, default=str))
+                groups.setdefault(key, []).append(request)
+            for requests in groups.values():
+                self.executor.submit(self.dispatch, requests)
+
+    def dispatch(self, requests):
+        lm, _, kwargs, _, _ = requests[0]
+        now = time.perf_counter()
+        with self.lock:
+            self.queue_delays.extend(now - request[3] for request in requests)
+            self.batch_sizes.append(len(requests))
+        try:
+            completions = self.backend(lm, [request[1] for request in requests], kwargs)
+        except Exception as e:
+            for request in requests:
+                request[4].set_exception(e)
+            return
+        for request, completion in zip(requests, completions):
+            request[4].set_result(completion)
+
+    def stats(self):
+        with self.lock:
+            delays = sorted(self.queue_delays)
+            sizes = list(self.batch_sizes)
+        return {
+            "batches": len(sizes),
+            "mean_batch_size": sum(sizes) / len(sizes) if sizes else 0.0,
+            "queue_delay_p50": delays[int(0.50 * (len(delays) - 1))] if delays else 0.0,
+            "queue_delay_p95": delays[int(0.95 * (len(delays) - 1))] if delays else 0.0,
+        }
+
+
+class BatchingLM:
+    """
+    Drop-in proxy for a dspy LM that routes requests through a shared
+    BatchDispatcher and blocks the calling agent until its result is back.
+    """
+
+    def __init__(self, lm, dispatcher):
+        self.lm = lm
+        self.dispatcher = dispatcher
+
+    def __getattr__(self, name):
+        return getattr(self.lm, name)
+
+    def __call__(self, prompt, **kwargs):
+        return self.dispatcher.submit(self.lm, prompt, kwargs).result()
+
+    def copy(self, **kwargs):
+        return BatchingLM(self.lm.copy(**kwargs), self.dispatcher)
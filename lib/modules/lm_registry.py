@@ -0,0 +1,77 @@
+import os
+import threading
+
+import dspy
+
+DEFAULT_LM_CONFIG = {"model": "gpt-4o-mini", "model_type": "chat", "temperature": 1.0}
+
+_lock = threading.Lock()
+_clients = {}
+
+
+def get_lm(model=None, model_type=None, **kwargs):
+    """
+    Returns the shared dspy LM client for a configuration, creating it once per
+    process. Agents borrow these clients and select them per call with
+    dspy.settings.context(lm=...), so no global configuration is needed and
+    agents running in different threads do not interfere.
+    """
+    config = {**DEFAULT_LM_CONFIG, **kwargs}
+    config["model"] = model or config["model"]
+    config["model_type"] = model_type or config["model_type"]
+    key = tuple(sorted(config.items()))
+    with _lock:
+        if key not in _clients:
+            _clients[key] = dspy.OpenAI(**config)
+        return _clients[key]
+
+
+def clear_lms():
+    with _lock:
+        _clients.clear()
+
+
+_dispatcher = None
+
+
+def get_batching_lm(
+    lm=None,
+    max_wait_ms=20,
+    max_batch_size=16,
+    batch_url=None,
+    max_in_flight=4,
+    **kwargs,
+):
+    """
+    Wraps an LM client so its requests are batched with those of every other
+    agent in the process. With batch_url, the base URL of an OpenAI compatible
+    server (API key in BATCH_API_KEY), a batch is one completions request,
+    otherwise its requests are sent concurrently. The dispatcher is created
+    on first use, its batching settings are fixed from then on.
+    """
+    from lib.modules.lm_batching import (
+        BatchDispatcher,
+        BatchingLM,
+        CompletionsBackend,
+        ConcurrentBackend,
+    )
+
+    global _dispatcher
+    with _lock:
+        if _dispatcher is None:
+            backend = (
+                CompletionsBackend(batch_url, api_key=os.getenv("BATCH_API_KEY"))
+                if batch_url
+                else ConcurrentBackend(max_concurrency=max_batch_size * max_in_flight)
+            )
+            _dispatcher = BatchDispatcher(
+                backend=backend,
+                max_wait_ms=max_wait_ms,
+                max_batch_size=max_batch_size,
+                max_in_flight=max_in_flight,
+            )
+    return BatchingLM(lm if lm is not None else get_lm(**kwargs), _dispatcher)
+
+
+def batching_stats():
+    return _dispatcher.stats() if _dispatcher is not None else {}
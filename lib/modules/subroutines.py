@@ -0,0 +1,114 @@
+import importlib
+import threading
+from collections.abc import Mapping
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+
+def load_object(path: str):
+    """
+    Imports "package.module:attribute".
+    """
+    module_name, attribute = path.split(":", 1)
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+@dataclass(frozen=True)
+class Subroutine:
+    """
+    Declares a subroutine of StepAgent: the dspy module factory that predicts
+    its actions, optionally with the signature and the Literal of allowed
+    actions it should use. References are "package.module:attribute" strings,
+    nothing is imported until the subroutine is used. A root_only subroutine
+    can only start a task, it is not an action other modules can call.
+    """
+
+    name: str
+    module: str
+    signature: Optional[str] = None
+    actions: Optional[str] = None
+    root_only: bool = False
+
+    def build(self, **kwargs):
+        factory = load_object(self.module)
+        if self.signature is not None:
+            kwargs["signature"] = load_object(self.signature)
+        if self.actions is not None:
+            kwargs["actions"] = load_object(self.actions)
+        return factory(**kwargs)
+
+
+_lock = threading.Lock()
+_subroutines: Dict[str, Subroutine] = {}
+
+
+def register_subroutine(name, module, signature=None, actions=None, root_only=False):
+    """
+    Adds a subroutine, or replaces the one with the same name. A subroutine
+    can be called by any module that lists "name [query]" in its actions,
+    unless it is root_only.
+    """
+    with _lock:
+        _subroutines[name] = Subroutine(name, module, signature, actions, root_only)
+
+
+def get_subroutine(name) -> Subroutine:
+    with _lock:
+        return _subroutines[name]
+
+
+def subroutine_names(callable_only=False):
+    with _lock:
+        return tuple(
+            name
+            for name, subroutine in _subroutines.items()
+            if not (callable_only and subroutine.root_only)
+        )
+
+
+register_subroutine(
+    "map_planner",
+    module="lib.modules.dspy_modules:MapPlanningModule",
+    signature="lib.modules.dspy_modules:MapAction",
+    actions="lib.modules.data_models:MapActions",
+    root_only=True,
+)
+register_subroutine(
+    "find_directions",
+    module="lib.modules.dspy_modules:FindDirectionModule",
+    signature="lib.modules.dspy_modules:FindDirectionAction",
+    actions="lib.modules.data_models:FindDirectionActions",
+)
+register_subroutine(
+    "search_nearest_place",
+    module="lib.modules.dspy_modules:SearchNearestPlaceModule",
+    signature="lib.modules.dspy_modules:SearchNearestPlaceAction",
+    actions="lib.modules.data_models:SearchNearestPlaceActions",
+)
+
+
+class SubroutineModules(Mapping):
+    """
+    Name to dspy module mapping over the registry, each module is built the
+    first time it is looked up and belongs to this mapping only, so agents do
+    not share module state.
+    """
+
+    def __init__(self):
+        self.modules = {}
+        self.lock = threading.Lock()
+
+    def __getitem__(self, name):
+        with self.lock:
+            if name not in self.modules:
+                self.modules[name] = get_subroutine(name).build()
+            return self.modules[name]
+
+    def __contains__(self, name):
+        return name in subroutine_names()
+
+    def __iter__(self):
+        return iter(subroutine_names())
+
+    def __len__(self):
+        return len(subroutine_names())
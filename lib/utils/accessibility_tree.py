@@ -0,0 +1,70 @@
+import re
+from dataclasses import dataclass
+from typing import List, Optional, Set
+
+NODE_PATTERN = re.compile(r"\[(\d+)\]\s*(.*)")
+ID_PATTERN = re.compile(r"^\t*\[(\d+)\]", re.MULTILINE)
+
+
+@dataclass
+class TreeNode:
+    index: int
+    node_id: Optional[str]
+    depth: int
+    content: str
+    line: str
+    parent: Optional[int] = None
+
+    @property
+    def key(self):
+        # Nodes without an id are keyed by their content
+        return self.node_id if self.node_id is not None else f"#{self.content}"
+
+
+def parse_tree(text: str) -> List[TreeNode]:
+    """
+    Parses the tab indented accessibility tree text produced by webarena,
+    e.g. "\\t\\t[1234] link 'Find directions'", into a flat list of nodes with
+    a link to their parent.
+    """
+    nodes = []
+    ancestors = []  # indices of the current ancestors, by depth
+    for line in text.split("\n"):
+        if not line.strip():
+            continue
+        index = len(nodes)
+        stripped = line.lstrip("\t")
+        depth = len(line) - len(stripped)
+        match = NODE_PATTERN.match(stripped)
+        if match:
+            node_id, content = match.group(1), match.group(2)
+        else:
+            node_id, content = None, stripped.strip()
+
+        del ancestors[depth:]
+        parent = ancestors[-1] if ancestors else None
+        nodes.append(
+            TreeNode(
+                index=index,
+                node_id=node_id,
+                depth=depth,
+                content=content,
+                line=line,
+                parent=parent,
+            )
+        )
+        ancestors.extend([index] * (depth + 1 - len(ancestors)))
+    return nodes
+
+
+def ancestor_indices(nodes: List[TreeNode], index: int) -> List[int]:
+    ancestors = []
+    parent = nodes[index].parent
+    while parent is not None:
+        ancestors.append(parent)
+        parent = nodes[parent].parent
+    return ancestors
+
+
+def element_ids(text: str) -> Set[str]:
+    return set(ID_PATTERN.findall(text))
@@ -0,0 +1,78 @@
+import os
+import pickle
+import tempfile
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+_current_checkpointer: ContextVar = ContextVar("checkpointer", default=None)
+
+CHECKPOINT_VERSION = 1
+
+
+class Checkpointer:
+    """
+    Saves the state of a running task after every step, so that a task whose
+    worker died continues from its last step instead of paying again for every
+    LM call and page load. A checkpoint holds the agent state (see
+    Agent.checkpoint_state) and the environment state (see
+    WebArenaEnvironmentWrapper.checkpoint). It is pickled, as the browser
+    actions hold numpy arrays, and replaced atomically.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.saves = 0
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+
+    def save(self, agent, env):
+        state = {
+            "version": CHECKPOINT_VERSION,
+            "step": env.steps,
+            "agent": agent.checkpoint_state(),
+            "env": env.checkpoint(),
+        }
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path) or ".")
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.path)
+        self.saves += 1
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path, "rb") as f:
+                state = pickle.load(f)
+        except Exception as e:
+            print(f"Ignoring unreadable checkpoint {self.path}: {e}")
+            return None
+        if state.get("version") != CHECKPOINT_VERSION:
+            print(f"Ignoring checkpoint {self.path} of another version")
+            return None
+        return state
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def resume(agent, env, state):
+    """
+    Navigates the environment back to the checkpointed page and rebuilds the
+    agent, the next act() continues with the step after the checkpoint.
+    """
+    env.restore_checkpoint(state["env"])
+    agent.restore_state(state["agent"])
+
+
+@contextmanager
+def use_checkpointer(checkpointer):
+    token = _current_checkpointer.set(checkpointer)
+    try:
+        yield checkpointer
+    finally:
+        _current_checkpointer.reset(token)
+
+
+def current_checkpointer():
+    return _current_checkpointer.get()
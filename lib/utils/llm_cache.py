@@ -0,0 +1,159 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+
+DEFAULT_CACHE_PATH = os.path.join("local_cache", "llm_cache.sqlite")
+
+
+def normalize_observation(observation):
+    return re.sub(r"[ \t]+", " ", observation or "").strip()
+
+
+def cache_key(
+    signature,
+    objective,
+    observation,
+    url,
+    previous_actions,
+    model=None,
+    temperature=None,
+):
+    payload = json.dumps(
+        {
+            "signature": signature.__name__,
+            "instructions": getattr(signature, "instructions", signature.__doc__),
+            "model": model,
+            "temperature": temperature,
+            "objective": objective,
+            "observation": normalize_observation(observation),
+            "url": url,
+            "previous_actions": [str(action) for action in previous_actions],
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """
+    Content addressed cache for predictor outputs, stored in SQLite so it can
+    be shared by every process of a run. Entries are evicted least recently
+    used first once max_entries or max_bytes is exceeded.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=100_000, max_bytes=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self.connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value TEXT, size INTEGER, last_access REAL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER)"
+            )
+
+    def connect(self):
+        # A connection per call keeps the cache safe across forked workers
+        return sqlite3.connect(self.path, timeout=30)
+
+    def count(self, conn, name):
+        conn.execute(
+            "INSERT INTO counters (name, value) VALUES (?, 1) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + 1",
+            (name,),
+        )
+
+    def get(self, key):
+        with self.connect() as conn:
+            row = conn.execute(
+                "SELECT value FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                self.count(conn, "misses")
+                return None
+            self.hits += 1
+            self.count(conn, "hits")
+            conn.execute(
+                "UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key)
+            )
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        value = json.dumps(value, default=str)
+        with self.connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, last_access) "
+                "VALUES (?, ?, ?, ?)",
+                (key, value, len(value), time.time()),
+            )
+            self.evict(conn)
+
+    def evict(self, conn):
+        num_entries, total_bytes = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+        ).fetchone()
+        if self.max_entries and num_entries > self.max_entries:
+            conn.execute(
+                "DELETE FROM entries WHERE key IN (SELECT key FROM entries "
+                "ORDER BY last_access ASC LIMIT ?)",
+                (num_entries - self.max_entries,),
+            )
+        if self.max_bytes and total_bytes > self.max_bytes:
+            rows = conn.execute(
+                "SELECT key, size FROM entries ORDER BY last_access ASC"
+            ).fetchall()
+            expired = []
+            for key, size in rows:
+                if total_bytes <= self.max_bytes:
+                    break
+                expired.append((key,))
+                total_bytes -= size
+            conn.executemany("DELETE FROM entries WHERE key = ?", expired)
+
+    def stats(self):
+        with self.connect() as conn:
+            counters = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+            num_entries, total_bytes = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+            ).fetchone()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "total_hits": counters.get("hits", 0),
+            "total_misses": counters.get("misses", 0),
+            "entries": num_entries,
+            "bytes": total_bytes,
+        }
+
+
+_llm_cache = None
+
+
+def get_llm_cache():
+    """
+    Process wide cache, configured through LLM_CACHE_PATH (empty disables it),
+    LLM_CACHE_MAX_ENTRIES and LLM_CACHE_MAX_BYTES.
+    """
+    global _llm_cache
+    path = os.getenv("LLM_CACHE_PATH", DEFAULT_CACHE_PATH)
+    if not path:
+        return None
+    if _llm_cache is None or _llm_cache.path != path:
+        max_bytes = os.getenv("LLM_CACHE_MAX_BYTES")
+        _llm_cache = LLMCache(
+            path=path,
+            max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", 100_000)),
+            max_bytes=int(max_bytes) if max_bytes else None,
+        )
+    return _llm_cache
@@ -0,0 +1,91 @@
+import gzip
+import json
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+_current_recorder: ContextVar = ContextVar("recorder", default=None)
+
+
+class TrajectoryRecorder:
+    """
+    Records a task as a stream of events (observations, LM requests and
+    responses, StepAgent stack transitions and env steps) into a gzipped
+    JSONL file. With path=None the events are only kept in memory.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.events = []
+        self.lock = threading.Lock()
+        self.file = gzip.open(path, "wt") if path else None
+
+    def record(self, event_type, **data):
+        event = {"type": event_type, **data}
+        with self.lock:
+            self.events.append(event)
+            if self.file is not None:
+                self.file.write(json.dumps(event, default=str) + "\n")
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def load_recording(path):
+    with gzip.open(path, "rt") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+@contextmanager
+def use_recorder(recorder):
+    token = _current_recorder.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _current_recorder.reset(token)
+
+
+def record(event_type, **data):
+    recorder = _current_recorder.get()
+    if recorder is not None:
+        recorder.record(event_type, **data)
+
+
+class RecordingLM:
+    """
+    Transparent proxy around a dspy LM that records every request with its
+    completions.
+    """
+
+    def __init__(self, lm, recorder):
+        self.lm = lm
+        self.recorder = recorder
+
+    def __getattr__(self, name):
+        return getattr(self.lm, name)
+
+    def __call__(self, prompt, **kwargs):
+        start = time.perf_counter()
+        completions = self.lm(prompt, **kwargs)
+        self.recorder.record(
+            "lm",
+            model=self.lm.kwargs.get("model"),
+            prompt=prompt,
+            kwargs=kwargs,
+            completions=completions,
+            latency=time.perf_counter() - start,
+        )
+        return completions
+
+    def copy(self, **kwargs):
+        return RecordingLM(self.lm.copy(**kwargs), self.recorder)
+
+
+def recording_lm(lm):
+    recorder = _current_recorder.get()
+    if recorder is None:
+        return lm
+    return RecordingLM(lm, recorder)
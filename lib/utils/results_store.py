@@ -0,0 +1,57 @@
+import fcntl
+import json
+import os
+
+
+class ResultsStore:
+    """
+    Append-only JSONL sink for per-task summary rows.
+    Every row is written with a single O_APPEND write under an exclusive
+    file lock, so any number of processes can append to the same file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def append(self, row):
+        line = (json.dumps(row, default=str) + "\n").encode("utf-8")
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            os.write(fd, line)
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    def read(self):
+        if not os.path.exists(self.path):
+            return []
+        rows = []
+        with open(self.path, "r") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    rows.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # A torn last line from a crashed writer
+                    print(f"Skipping malformed row in {self.path}")
+        return rows
+
+    def compact(self, output_file):
+        """
+        Exports the rows to CSV or Parquet (by extension), keeping the last
+        row written for each task_id.
+        """
+        import pandas as pd
+
+        rows = {}
+        for row in self.read():
+            rows[row.get("task_id", len(rows))] = row
+        df_summary = pd.DataFrame(list(rows.values()))
+        if output_file.endswith(".parquet"):
+            df_summary.to_parquet(output_file, index=False)
+        else:
+            df_summary.to_csv(output_file, index=False)
+        return df_summary
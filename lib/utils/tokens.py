@@ -0,0 +1,9 @@
+# Rough token estimate used for budgets and reporting, close enough for
+# OpenAI tokenizers on English and accessibility tree text.
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text) -> int:
+    if not text:
+        return 0
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
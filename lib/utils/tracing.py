@@ -0,0 +1,93 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from functools import wraps
+
+_current_tracer: ContextVar = ContextVar("tracer", default=None)
+_null_span = nullcontext()
+
+
+class Tracer:
+    """
+    Collects complete ("X") trace events that can be opened in chrome://tracing
+    or Perfetto, and summarises span latencies per phase.
+    """
+
+    def __init__(self):
+        self.events = []
+        self.pid = os.getpid()
+
+    @contextmanager
+    def span(self, name, **args):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self.events.append(
+                {
+                    "name": name,
+                    "ph": "X",
+                    "ts": start * 1e6,
+                    "dur": (end - start) * 1e6,
+                    "pid": self.pid,
+                    "tid": threading.get_ident(),
+                    "args": args,
+                }
+            )
+
+    def export_chrome_trace(self, path):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, f)
+
+    def phase_percentiles(self):
+        durations = {}
+        for event in self.events:
+            durations.setdefault(event["name"], []).append(event["dur"] / 1e6)
+        summary = {}
+        for name, values in durations.items():
+            values.sort()
+            summary[f"{name}_p50"] = values[int(0.50 * (len(values) - 1))]
+            summary[f"{name}_p95"] = values[int(0.95 * (len(values) - 1))]
+        return summary
+
+
+@contextmanager
+def use_tracer(tracer):
+    token = _current_tracer.set(tracer)
+    try:
+        yield tracer
+    finally:
+        _current_tracer.reset(token)
+
+
+def span(name, **args):
+    tracer = _current_tracer.get()
+    if tracer is None:
+        return _null_span
+    return tracer.span(name, **args)
+
+
+def traced(name):
+    """
+    Records a span around every call of the decorated function while a
+    tracer is active, and costs a single context variable lookup otherwise.
+    """
+
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            tracer = _current_tracer.get()
+            if tracer is None:
+                return fn(*args, **kwargs)
+            with tracer.span(name):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,179 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import zlib
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+_current_writer: ContextVar = ContextVar("trajectory_writer", default=None)
+
+HISTORY_KEYS = ("previous_actions", "previous_responses", "previous_reasons")
+
+
+class BlobStore:
+    """
+    Content addressed store for observations, compressed with zlib and keyed
+    by their sha256. Identical observations (the same page seen by several
+    steps or tasks) are stored once. With root=None the blobs are kept in
+    memory, otherwise one file per blob under root, safe to share between
+    processes.
+    """
+
+    def __init__(self, root=None):
+        self.root = root
+        self.blobs = {}
+        self.lock = threading.Lock()
+        if self.root:
+            os.makedirs(self.root, exist_ok=True)
+
+    def blob_path(self, digest):
+        return os.path.join(self.root, digest[:2], digest[2:] + ".z")
+
+    def put(self, text: str) -> str:
+        data = text.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        if self.root is None:
+            with self.lock:
+                if digest not in self.blobs:
+                    self.blobs[digest] = zlib.compress(data)
+            return digest
+        path = self.blob_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Written under a temporary name so readers never see partial blobs
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(fd, "wb") as f:
+                f.write(zlib.compress(data))
+            os.replace(tmp_path, path)
+        return digest
+
+    def get(self, digest: str) -> str:
+        if self.root is None:
+            with self.lock:
+                data = self.blobs[digest]
+        else:
+            with open(self.blob_path(digest), "rb") as f:
+                data = f.read()
+        return zlib.decompress(data).decode("utf-8")
+
+
+class TrajectoryWriter:
+    """
+    Streams the agent's step records as JSONL, one line per step, flushed as
+    soon as the step is logged. Observations go to the blob store and the
+    previous actions, responses and reasons are written as deltas against the
+    previous record. With path=None the records are kept in memory, with
+    append=True the records follow those already in the file (resumed tasks).
+    """
+
+    def __init__(self, path=None, blob_store=None, append=False):
+        self.path = path
+        self.blob_store = blob_store if blob_store is not None else BlobStore()
+        self.records = []
+        self.written = {}  # history key -> (list id, number of items written)
+        self.lock = threading.Lock()
+        self.file = None
+        if self.path:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self.file = open(self.path, "a" if append else "w")
+
+    def history_delta(self, key, items, end):
+        """
+        The items of items[:end] not written yet. History lists only grow, a
+        different or shorter list means the history was reset.
+        """
+        list_id, count = self.written.get(key, (None, 0))
+        self.written[key] = (id(items), end)
+        if list_id == id(items) and end >= count:
+            return {"append": items[count:end]}
+        return {"reset": items[:end]}
+
+    def write_step(self, objective, url, observation, history, **fields):
+        """
+        history maps each history key to (items, end), the record holds
+        items[:end].
+        """
+        with self.lock:
+            record = {
+                "objective": objective,
+                "url": url,
+                "observation": self.blob_store.put(observation or ""),
+                "history": {
+                    key: self.history_delta(key, items, end)
+                    for key, (items, end) in history.items()
+                },
+                **fields,
+            }
+            if self.file is not None:
+                self.file.write(json.dumps(record, default=str) + "\n")
+                self.file.flush()
+            else:
+                self.records.append(record)
+
+    def view(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.flush()
+                return read_trajectory(self.path, self.blob_store)
+            return rebuild(self.records, self.blob_store)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def rebuild(records, blob_store):
+    """
+    Expands streamed records back into the full per step view, with the
+    observation text and the complete history lists.
+    """
+    history = {key: [] for key in HISTORY_KEYS}
+    steps = []
+    for record in records:
+        record = dict(record)
+        for key, delta in record.pop("history").items():
+            if "reset" in delta:
+                history[key] = list(delta["reset"])
+            else:
+                history[key] = history[key] + delta["append"]
+        step = {
+            "objective": record.pop("objective"),
+            "url": record.pop("url"),
+            "observation": blob_store.get(record.pop("observation")),
+        }
+        for key in HISTORY_KEYS:
+            step[key] = list(history[key])
+        step.update(record)
+        steps.append(step)
+    return steps
+
+
+def read_trajectory(path, blob_store):
+    records = []
+    with open(path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                # A torn last line from a crashed writer
+                print(f"Skipping malformed record in {path}")
+    return rebuild(records, blob_store)
+
+
+@contextmanager
+def use_trajectory_writer(writer):
+    token = _current_writer.set(writer)
+    try:
+        yield writer
+    finally:
+        _current_writer.reset(token)
+
+
+def current_trajectory_writer():
+    return _current_writer.get()
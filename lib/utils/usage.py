@@ -0,0 +1,263 @@
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing, contextmanager
+from contextvars import ContextVar
+
+from lib.utils.tokens import estimate_tokens
+
+_current_meters: ContextVar = ContextVar("usage_meters", default=())
+
+# USD per million prompt and completion tokens
+PRICES = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4-turbo": (10.00, 30.00),
+    "gpt-3.5-turbo": (0.50, 1.50),
+}
+
+
+def price(model, prompt_tokens, completion_tokens) -> float:
+    prompt_price, completion_price = PRICES.get(model or "", (0.0, 0.0))
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1e6
+
+
+class BudgetExceeded(Exception):
+    pass
+
+
+class SharedUsage:
+    """
+    Token and cost totals in SQLite, shared by the worker processes of a run
+    (and the nodes of a multi-node run) so that they spend one budget. Each
+    LM call adds to the totals with a single atomic UPDATE.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with closing(self.connect()) as conn:
+            conn.execute("PRAGMA journal_mode=DELETE")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS usage ("
+                "id INTEGER PRIMARY KEY CHECK (id = 0), "
+                "tokens INTEGER NOT NULL, cost REAL NOT NULL)"
+            )
+            conn.execute("INSERT OR IGNORE INTO usage VALUES (0, 0, 0.0)")
+
+    def connect(self):
+        return sqlite3.connect(self.path, timeout=60, isolation_level=None)
+
+    def add(self, tokens, cost):
+        with closing(self.connect()) as conn:
+            conn.execute(
+                "UPDATE usage SET tokens = tokens + ?, cost = cost + ? WHERE id = 0",
+                (tokens, cost),
+            )
+
+    def totals(self):
+        with closing(self.connect()) as conn:
+            return conn.execute(
+                "SELECT tokens, cost FROM usage WHERE id = 0"
+            ).fetchone()
+
+
+class UsageMeter:
+    """
+    Totals of LM calls: prompt and completion tokens, latency and cost, per
+    model. With max_tokens or max_cost set, check() raises BudgetExceeded
+    once the budget is used up, which is done before every metered call.
+    With shared set, the budget is checked against the SharedUsage totals,
+    which the meter adds to as well.
+    """
+
+    def __init__(self, name="task", max_tokens=None, max_cost=None, shared=None):
+        self.name = name
+        self.max_tokens = max_tokens
+        self.max_cost = max_cost
+        self.shared = shared
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.calls = 0
+            self.prompt_tokens = 0
+            self.completion_tokens = 0
+            self.latency = 0.0
+            self.cost = 0.0
+            self.models = {}
+            self.exceeded = False
+
+    def add(self, model, prompt_tokens, completion_tokens, latency):
+        with self.lock:
+            self.calls += 1
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+            self.latency += latency
+            cost = price(model, prompt_tokens, completion_tokens)
+            self.cost += cost
+            self.models[model] = self.models.get(model, 0) + 1
+        if self.shared is not None:
+            self.shared.add(prompt_tokens + completion_tokens, cost)
+
+    def over_budget(self):
+        """
+        Why the totals have reached a budget, or None. Marks the meter as
+        exceeded, check() raises on the same condition.
+        """
+        if self.max_tokens is None and self.max_cost is None:
+            return None
+        if self.shared is not None:
+            tokens, cost = self.shared.totals()
+        else:
+            with self.lock:
+                tokens = self.prompt_tokens + self.completion_tokens
+                cost = self.cost
+        if self.max_tokens is not None and tokens >= self.max_tokens:
+            self.exceeded = True
+            return f"{self.name} token budget exceeded: {tokens} >= {self.max_tokens}"
+        if self.max_cost is not None and cost >= self.max_cost:
+            self.exceeded = True
+            return f"{self.name} cost budget exceeded: {cost:.4f} >= {self.max_cost}"
+        return None
+
+    def check(self):
+        reason = self.over_budget()
+        if reason is not None:
+            raise BudgetExceeded(reason)
+
+    def state(self):
+        with self.lock:
+            return {
+                "calls": self.calls,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "latency": self.latency,
+                "cost": self.cost,
+                "models": dict(self.models),
+            }
+
+    def load_state(self, state):
+        with self.lock:
+            for name, value in state.items():
+                setattr(self, name, value)
+
+    def summary(self, prefix="lm_"):
+        with self.lock:
+            return {
+                f"{prefix}calls": self.calls,
+                f"{prefix}prompt_tokens": self.prompt_tokens,
+                f"{prefix}completion_tokens": self.completion_tokens,
+                f"{prefix}latency": round(self.latency, 3),
+                f"{prefix}cost_usd": round(self.cost, 6),
+                f"{prefix}models": dict(self.models),
+            }
+
+
+@contextmanager
+def use_usage(meter):
+    """
+    Meters the LM calls made in this context into meter, on top of the meters
+    of enclosing contexts (e.g. subroutine frame, task and run).
+    """
+    if meter is None:
+        yield meter
+        return
+    token = _current_meters.set(_current_meters.get() + (meter,))
+    try:
+        yield meter
+    finally:
+        _current_meters.reset(token)
+
+
+def response_usage(lm, prompt, completions):
+    """
+    Token counts reported by the API for the last request when the client
+    keeps them (dspy clients store responses in history), estimated otherwise.
+    """
+    try:
+        entry = lm.history[-1]
+        usage = entry["response"]["usage"]
+        if entry["prompt"] == prompt:
+            return usage["prompt_tokens"], usage["completion_tokens"]
+    except Exception:
+        pass
+    completion_tokens = sum(estimate_tokens(str(c)) for c in completions or [])
+    return estimate_tokens(prompt), completion_tokens
+
+
+class MeteredLM:
+    """
+    Transparent proxy around a dspy LM that checks the budgets before each
+    request and adds its usage to the meters afterwards. Every request goes
+    through it, including the retries of TypedPredictor.
+    """
+
+    def __init__(self, lm, meters):
+        self.lm = lm
+        self.meters = meters
+
+    def __getattr__(self, name):
+        return getattr(self.lm, name)
+
+    def __call__(self, prompt, **kwargs):
+        for meter in self.meters:
+            meter.check()
+        start = time.perf_counter()
+        completions = self.lm(prompt, **kwargs)
+        latency = time.perf_counter() - start
+        prompt_tokens, completion_tokens = response_usage(self.lm, prompt, completions)
+        model = self.lm.kwargs.get("model")
+        for meter in self.meters:
+            meter.add(model, prompt_tokens, completion_tokens, latency)
+        return completions
+
+    def copy(self, **kwargs):
+        return MeteredLM(self.lm.copy(**kwargs), self.meters)
+
+
+def metered_lm(lm):
+    meters = _current_meters.get()
+    if not meters:
+        return lm
+    return MeteredLM(lm, meters)
+
+
+def env_budget(prefix):
+    max_tokens = os.getenv(f"{prefix}_MAX_TOKENS")
+    max_cost = os.getenv(f"{prefix}_MAX_COST")
+    return {
+        "max_tokens": int(max_tokens) if max_tokens else None,
+        "max_cost": float(max_cost) if max_cost else None,
+    }
+
+
+def task_budget():
+    """
+    Default per task budget, configured through LM_TASK_MAX_TOKENS and
+    LM_TASK_MAX_COST (USD).
+    """
+    return env_budget("LM_TASK")
+
+
+_run_usage = None
+
+
+def get_run_usage():
+    """
+    Meter shared by all tasks run in this process, with the budget configured
+    through LM_RUN_MAX_TOKENS and LM_RUN_MAX_COST (USD). With
+    LM_RUN_USAGE_PATH set, the budget is spent together with every process
+    using the same SharedUsage database.
+    """
+    global _run_usage
+    if _run_usage is None:
+        path = os.getenv("LM_RUN_USAGE_PATH")
+        _run_usage = UsageMeter(
+            name="run",
+            shared=SharedUsage(path) if path else None,
+            **env_budget("LM_RUN"),
+        )
+    return _run_usage
@@ -0,0 +1,199 @@
+import os
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import closing, contextmanager
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class WorkQueue:
+    """
+    Lease based task queue in SQLite, shared by the eval workers of every node
+    through a common filesystem (which must support file locking).
+    A worker leases a task for lease_seconds and keeps the lease alive with
+    heartbeats. Leases of crashed workers expire and their tasks go back to
+    pending, until a task has been attempted max_attempts times and is marked
+    failed.
+    The database uses the rollback journal: WAL keeps its index in per-host
+    shared memory and does not work over network filesystems.
+    """
+
+    def __init__(self, path, lease_seconds=300, max_attempts=3):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with closing(self.connect()) as conn:
+            conn.execute("PRAGMA journal_mode=DELETE")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS tasks ("
+                "config_file TEXT PRIMARY KEY, status TEXT NOT NULL, "
+                "attempts INTEGER NOT NULL DEFAULT 0, worker TEXT, "
+                "lease_expires REAL, updated REAL, error TEXT)"
+            )
+
+    def connect(self):
+        # A connection per call keeps the queue safe across forked workers
+        return sqlite3.connect(self.path, timeout=60, isolation_level=None)
+
+    @contextmanager
+    def transaction(self):
+        conn = self.connect()
+        try:
+            # Takes the write lock up front so two workers never lease the same task
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    def enqueue(self, config_files):
+        """
+        Adds tasks as pending, tasks already in the queue are left as they are.
+        """
+        now = time.time()
+        with self.transaction() as conn:
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO tasks (config_file, status, updated) "
+                "VALUES (?, 'pending', ?)",
+                [(config_file, now) for config_file in config_files],
+            )
+            return conn.total_changes - before
+
+    def requeue_expired(self, conn, now):
+        conn.execute(
+            "UPDATE tasks SET status = CASE WHEN attempts >= ? THEN 'failed' "
+            "ELSE 'pending' END, worker = NULL, updated = ?, "
+            "error = COALESCE(error, 'lease expired') "
+            "WHERE status = 'leased' AND lease_expires < ?",
+            (self.max_attempts, now, now),
+        )
+
+    def acquire(self, worker_id):
+        """
+        Leases the next pending task, returns its config file or None when
+        nothing is left to do.
+        """
+        now = time.time()
+        with self.transaction() as conn:
+            self.requeue_expired(conn, now)
+            row = conn.execute(
+                "SELECT config_file FROM tasks WHERE status = 'pending' "
+                "ORDER BY attempts, rowid LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE tasks SET status = 'leased', worker = ?, "
+                "attempts = attempts + 1, lease_expires = ?, updated = ? "
+                "WHERE config_file = ?",
+                (worker_id, now + self.lease_seconds, now, row[0]),
+            )
+            return row[0]
+
+    def heartbeat(self, config_file, worker_id):
+        """
+        Extends the lease, returns False when the worker no longer holds it.
+        """
+        now = time.time()
+        with self.transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE tasks SET lease_expires = ?, updated = ? "
+                "WHERE config_file = ? AND worker = ? AND status = 'leased'",
+                (now + self.lease_seconds, now, config_file, worker_id),
+            )
+            return cursor.rowcount == 1
+
+    def complete(self, config_file, worker_id):
+        with self.transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE tasks SET status = 'done', lease_expires = NULL, "
+                "updated = ?, error = NULL "
+                "WHERE config_file = ? AND worker = ? AND status = 'leased'",
+                (time.time(), config_file, worker_id),
+            )
+            return cursor.rowcount == 1
+
+    def fail(self, config_file, worker_id, error):
+        """
+        Gives the task back to the queue, or marks it failed once it has used
+        up its attempts.
+        """
+        with self.transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE tasks SET status = CASE WHEN attempts >= ? THEN 'failed' "
+                "ELSE 'pending' END, worker = NULL, lease_expires = NULL, "
+                "updated = ?, error = ? "
+                "WHERE config_file = ? AND worker = ? AND status = 'leased'",
+                (self.max_attempts, time.time(), error, config_file, worker_id),
+            )
+            return cursor.rowcount == 1
+
+    def release(self, config_file, worker_id):
+        """
+        Gives the task back to the queue without using up an attempt, for a
+        worker that stops before running it.
+        """
+        with self.transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE tasks SET status = 'pending', attempts = attempts - 1, "
+                "worker = NULL, lease_expires = NULL, updated = ? "
+                "WHERE config_file = ? AND worker = ? AND status = 'leased'",
+                (time.time(), config_file, worker_id),
+            )
+            return cursor.rowcount == 1
+
+    @contextmanager
+    def lease(self, config_file, worker_id):
+        """
+        Sends heartbeats from a background thread while the task runs.
+        """
+        stop = threading.Event()
+
+        def beat():
+            while not stop.wait(self.lease_seconds / 3):
+                try:
+                    held = self.heartbeat(config_file, worker_id)
+                except sqlite3.OperationalError as e:
+                    # e.g. "database is locked", the next beat retries
+                    print(f"Heartbeat for {config_file} failed: {e}")
+                    continue
+                if not held:
+                    print(f"Lost the lease on {config_file}")
+                    return
+
+        thread = threading.Thread(target=beat, daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    def stats(self):
+        with closing(self.connect()) as conn:
+            counts = dict(
+                conn.execute(
+                    "SELECT status, COUNT(*) FROM tasks GROUP BY status"
+                ).fetchall()
+            )
+        return {
+            status: counts.get(status, 0)
+            for status in ("pending", "leased", "done", "failed")
+        }
+
+    def failed(self):
+        with closing(self.connect()) as conn:
+            return conn.execute(
+                "SELECT config_file, attempts, error FROM tasks "
+                "WHERE status = 'failed' ORDER BY config_file"
+            ).fetchall()
@@ -0,0 +1,100 @@
+import hashlib
+import threading
+from html import escape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+MODES = ["Car (OSRM)", "Bicycle (OSRM)", "Foot (OSRM)"]
+
+HEADER = """<html><head><title>{title} | OpenStreetMap</title></head><body>
+<header><h1>OpenStreetMap</h1>
+<nav><a href="/">Edit</a> <a href="/">History</a> <a href="/">Export</a>
+<a href="/">GPS Traces</a> <a href="/">User Diaries</a> <a href="/">Communities</a>
+<a href="/">Copyright</a> <a href="/">Help</a> <a href="/">About</a>
+<a href="/">Log In</a> <a href="/">Sign Up</a></nav></header>
+"""
+
+# Stand-in for the map tiles and layer controls that bloat the real tree
+MAP_PANEL = "<div id='map'>{}</div>".format(
+    "".join(f"<p>Map tile {i}, zoom level {i % 19}</p>" for i in range(150))
+)
+
+
+def route_summary(origin, destination, mode):
+    digest = hashlib.sha256(f"{origin}|{destination}|{mode}".encode()).digest()
+    distance = 1 + digest[0] % 200 / 10
+    minutes = int(distance * (12 if mode.startswith("Foot") else 2)) + 1
+    return f"Distance: {distance:.1f}km. Time: {minutes // 60}:{minutes % 60:02d}."
+
+
+def index_page():
+    return (
+        HEADER.format(title="Map")
+        + """<form action="/search"><input type="text" name="query" aria-label="Search">
+<button type="submit">Go</button></form>
+<a href="/directions" title="Find directions between two points">Find directions</a>
+"""
+        + MAP_PANEL
+        + "</body></html>"
+    )
+
+
+def directions_page():
+    options = "".join(f"<option>{mode}</option>" for mode in MODES)
+    return (
+        HEADER.format(title="Directions")
+        + f"""<form action="/route">
+<input type="text" name="from" aria-label="From">
+<input type="text" name="to" aria-label="To">
+<select name="mode" aria-label="Mode">{options}</select>
+<button type="submit">Go</button></form>
+"""
+        + MAP_PANEL
+        + "</body></html>"
+    )
+
+
+def route_page(query):
+    origin = query.get("from", [""])[0]
+    destination = query.get("to", [""])[0]
+    mode = query.get("mode", [MODES[0]])[0]
+    summary = route_summary(origin, destination, mode)
+    return (
+        HEADER.format(title="Route")
+        + f"""<h2>Directions from {escape(origin)} to {escape(destination)}</h2>
+<p>{escape(summary)}</p><ol>"""
+        + "".join(f"<li>Turn {i}: continue straight</li>" for i in range(1, 20))
+        + "</ol>"
+        + MAP_PANEL
+        + "</body></html>"
+    )
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/directions":
+            body = directions_page()
+        elif url.path == "/route":
+            body = route_page(parse_qs(url.query))
+        else:
+            body = index_page()
+        data = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_fixture_site(host="127.0.0.1", port=0):
+    """
+    Serves the OSM-like fixture site from a background thread.
+    Returns the server and its base url, call server.shutdown() when done.
+    """
+    server = ThreadingHTTPServer((host, port), FixtureHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
@@ -0,0 +1,84 @@
+import argparse
+import json
+import subprocess
+import sys
+
+# Runs in a fresh interpreter so nothing is imported yet, as in a spawned worker
+PROBE = """
+import json, time
+start = time.perf_counter()
+from lib.agents.step_agent import StepAgent
+imported = time.perf_counter()
+agent = StepAgent(lm=object(), macro_cache=None, loop_policy=None)
+constructed = time.perf_counter()
+agent.action_to_prompt_dict[agent.root_action]
+built = time.perf_counter()
+print(json.dumps({
+    "import_time": imported - start,
+    "agent_init_time": constructed - imported,
+    "first_module_time": built - constructed,
+}))
+"""
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except Exception:
+        return None
+
+
+def parse_importtime(stderr, top):
+    """
+    Top modules by cumulative import time from python -X importtime output,
+    "import time: self [us] | cumulative | imported package".
+    """
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        modules.append((int(cumulative), name.strip()))
+    modules.sort(reverse=True)
+    return [{"module": name, "cumulative_s": us / 1e6} for us, name in modules[:top]]
+
+
+def run(repeat=3, top=15, output_file=None):
+    timings = []
+    stderr = ""
+    for _ in range(repeat):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", PROBE],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        timings.append(json.loads(result.stdout.strip().splitlines()[-1]))
+        stderr = result.stderr
+    results = {
+        "commit": git_commit(),
+        "repeat": repeat,
+        **{
+            key: min(timing[key] for timing in timings)
+            for key in ("import_time", "agent_init_time", "first_module_time")
+        },
+        "top_imports": parse_importtime(stderr, top),
+    }
+
+    output = json.dumps(results, indent=4)
+    if output_file:
+        with open(output_file, "w") as f:
+            f.write(output)
+    print(output)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--output_file", type=str, default=None)
+    args = parser.parse_args()
+    run(repeat=args.repeat, top=args.top, output_file=args.output_file)
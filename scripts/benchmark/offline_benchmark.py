@@ -0,0 +1,172 @@
+import os
+
+# Every step has to reach the scripted LM to be measured
+os.environ["LLM_CACHE_PATH"] = ""
+os.environ["MACRO_CACHE_PATH"] = ""
+
+import argparse
+import json
+import resource
+import subprocess
+import tempfile
+import time
+
+from lib.agents.step_agent import StepAgent
+from lib.environments.webarena import WebArenaEnvironmentWrapper
+from lib.utils.tokens import CHARS_PER_TOKEN
+from lib.utils.tracing import Tracer, use_tracer
+from scripts.benchmark.fixture_site import MODES, route_summary, serve_fixture_site
+from scripts.benchmark.scripted_lm import ScriptedLM
+
+PLACES = [
+    "Carnegie Mellon University",
+    "University of Pittsburgh",
+    "Phipps Conservatory",
+    "Pittsburgh International Airport",
+    "Carnegie Music Hall",
+    "Schenley Park",
+    "PNC Park",
+    "Hunt Library",
+]
+
+
+def write_task_configs(base_url, num_tasks, config_dir):
+    config_files = []
+    for task_id in range(num_tasks):
+        origin = PLACES[task_id % len(PLACES)]
+        destination = PLACES[(task_id * 3 + 1) % len(PLACES)]
+        config = {
+            "task_id": task_id,
+            "sites": ["map"],
+            "require_login": False,
+            "storage_state": None,
+            "start_url": base_url,
+            "geolocation": None,
+            "intent": f"What is the walking distance from {origin} to {destination}?",
+            "require_reset": False,
+            "eval": {
+                "eval_types": ["string_match"],
+                "reference_answers": {
+                    "must_include": [route_summary(origin, destination, MODES[2])]
+                },
+                "reference_url": "",
+                "program_html": [],
+            },
+        }
+        config_file = os.path.join(config_dir, f"{task_id}.json")
+        with open(config_file, "w") as f:
+            json.dump(config, f)
+        config_files.append(config_file)
+    return config_files
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[int(q * (len(values) - 1))]
+
+
+def run_task(config_file, max_browser_rows, adaptive_settle=False):
+    lm = ScriptedLM()
+    tracer = Tracer()
+    start = time.perf_counter()
+    with use_tracer(tracer):
+        env = WebArenaEnvironmentWrapper(
+            config_file=config_file,
+            max_steps=50,
+            max_browser_rows=max_browser_rows,
+            slow_mo=0,
+            headless=True,
+            adaptive_settle=adaptive_settle,
+        )
+        agent = StepAgent(max_actions=50, verbose=False, logging=False, lm=lm)
+        status = agent.act(objective=env.get_objective(), env=env)
+        env.close()
+    wall_time = time.perf_counter() - start
+
+    steps = max(status["num_actions"], 1)
+    prompt_chars = sum(lm.prompt_chars)
+    observation_times = [
+        event["dur"] / 1e6 for event in tracer.events if event["name"] == "observation"
+    ]
+    return {
+        "task": config_file,
+        "wall_time": wall_time,
+        "steps": status["num_actions"],
+        "lm_calls": len(lm.prompt_chars),
+        "prompt_chars_per_step": prompt_chars / steps,
+        "prompt_tokens_per_step": prompt_chars / CHARS_PER_TOKEN / steps,
+        "observation_times": observation_times,
+        "reward": status["reward"],
+        "mean_settle_time": status.get("mean_settle_time", 0.0),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except Exception:
+        return None
+
+
+def run(num_tasks=8, max_browser_rows=300, adaptive_settle=False, output_file=None):
+    server, base_url = serve_fixture_site()
+    try:
+        with tempfile.TemporaryDirectory() as config_dir:
+            config_files = write_task_configs(base_url, num_tasks, config_dir)
+            start = time.perf_counter()
+            tasks = [
+                run_task(config_file, max_browser_rows, adaptive_settle)
+                for config_file in config_files
+            ]
+            wall_time = time.perf_counter() - start
+    finally:
+        server.shutdown()
+
+    steps = sum(task["steps"] for task in tasks)
+    observation_times = [t for task in tasks for t in task.pop("observation_times")]
+    results = {
+        "commit": git_commit(),
+        "num_tasks": num_tasks,
+        "steps": steps,
+        "wall_time": wall_time,
+        "steps_per_sec": steps / wall_time if wall_time else 0.0,
+        "wall_time_per_task": wall_time / max(num_tasks, 1),
+        "prompt_chars_per_step": sum(t["prompt_chars_per_step"] for t in tasks)
+        / max(num_tasks, 1),
+        "prompt_tokens_per_step": sum(t["prompt_tokens_per_step"] for t in tasks)
+        / max(num_tasks, 1),
+        "observation_time_p50": percentile(observation_times, 0.50),
+        "observation_time_p95": percentile(observation_times, 0.95),
+        # ru_maxrss is in KB on Linux, children only covers exited Chromium processes
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "peak_rss_children_mb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        / 1024,
+        "success_rate": sum(t["reward"] for t in tasks) / max(num_tasks, 1),
+        "tasks": tasks,
+    }
+
+    output = json.dumps(results, indent=4)
+    if output_file:
+        with open(output_file, "w") as f:
+            f.write(output)
+    print(output)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num_tasks", type=int, default=8)
+    parser.add_argument("--max_browser_rows", type=int, default=300)
+    parser.add_argument("--adaptive_settle", action="store_true")
+    parser.add_argument("--output_file", type=str, default=None)
+    args = parser.parse_args()
+    run(
+        num_tasks=args.num_tasks,
+        max_browser_rows=args.max_browser_rows,
+        adaptive_settle=args.adaptive_settle,
+        output_file=args.output_file,
+    )
@@ -0,0 +1,80 @@
+import re
+
+from dsp.modules.lm import LM
+
+from scripts.benchmark.fixture_site import MODES
+
+
+def last_field(prompt, prefix, next_prefix=None):
+    start = prompt.rfind(prefix)
+    if start == -1:
+        return ""
+    start += len(prefix)
+    end = prompt.find(next_prefix, start) if next_prefix else -1
+    return prompt[start:end if end != -1 else None].strip()
+
+
+def element_id(observation, role, name):
+    match = re.search(rf"\[(\d+)\] {role} '{re.escape(name)}", observation)
+    return match.group(1) if match else None
+
+
+class ScriptedLM(LM):
+    """
+    Deterministic stand-in LM for the fixture site. It reads the observation,
+    url and previous actions out of the dspy prompt and answers with the
+    action a competent model would pick, so StepAgent runs end to end.
+    """
+
+    def __init__(self):
+        super().__init__(model="scripted")
+        self.provider = "scripted"
+        self.prompt_chars = []
+
+    def policy(self, prompt):
+        objective = last_field(prompt, "Objective:", "Observation:")
+        observation = last_field(prompt, "Observation:", "Url:")
+        url = last_field(prompt, "Url:", "Previous Actions:")
+        previous = last_field(prompt, "Previous Actions:", "Next Action:")
+
+        if "MUST use find_directions" in prompt:
+            answer = re.search(r"Distance: [^\"'\]]+", previous)
+            if answer:
+                return f"stop [{answer.group(0).strip()}]"
+            return f"find_directions [{objective}]"
+
+        if "/route" in url:
+            answer = re.search(r"Distance: [^'\n]+", observation)
+            return f"stop [{answer.group(0).strip() if answer else 'N/A'}]"
+        if "/directions" in url:
+            places = re.search(r"from (.+?) to (.+?)[\]?]", objective)
+            origin, destination = places.groups() if places else ("", "")
+            num_typed = previous.count("type [")
+            if num_typed == 0:
+                from_id = element_id(observation, "textbox", "From")
+                return f"type [{from_id}] [{origin}] [0]"
+            if num_typed == 1:
+                to_id = element_id(observation, "textbox", "To")
+                return f"type [{to_id}] [{destination}] [0]"
+            if "select [" not in previous:
+                mode_id = element_id(observation, "combobox", "Mode")
+                return f"select [{mode_id}] [{MODES[2]}]"
+            return f"click [{element_id(observation, 'button', 'Go')}]"
+        return f"click [{element_id(observation, 'link', 'Find directions')}]"
+
+    def basic_request(self, prompt, **kwargs):
+        self.prompt_chars.append(len(prompt))
+        completion = self.policy(prompt)
+        self.history.append(
+            {"prompt": prompt, "response": completion, "kwargs": kwargs}
+        )
+        return [completion]
+
+    def __call__(self, prompt, only_completed=True, return_sorted=False, **kwargs):
+        return self.basic_request(prompt, **kwargs)
+
+    def copy(self, **kwargs):
+        return self
+
+    def inspect_history(self, n=1, skip=0):
+        pass
@@ -5,6 +5,9 @@ os.environ["OPENAI_API_KEY"] = os.getenv("OPENAPI_PERSONAL", "")
 
 from lib.agents.step_agent import StepAgent
 from lib.environments.webarena import WebArenaEnvironmentWrapper
+from lib.agents.macro_cache import get_macro_cache
+from lib.modules.action_parser import repair_stats
+from lib.utils.llm_cache import get_llm_cache
 
 
 def run():
@@ -13,6 +16,7 @@ def run():
         verbose=True,
         logging=True,
         debug=False,
+        inspect_history=True,
     )
 
     #####
@@ -32,6 +36,7 @@ def run():
         current_viewport_only=False,
         viewport_size={"width": 1280, "height": 720},
         headless=False,
+        adaptive_settle=True,
     )
 
     agent = agent_init()
@@ -39,6 +44,15 @@ def run():
     status = agent.act(objective=objective, env=env)
     env.close()
 
+    llm_cache = get_llm_cache()
+    if llm_cache is not None:
+        print(f"LLM cache: {llm_cache.stats()}")
+    print(f"Action repair: {repair_stats.snapshot()}")
+    print(f"LM usage: {agent.usage.summary()}")
+    macro_cache = get_macro_cache()
+    if macro_cache is not None:
+        print(f"Macro cache: {macro_cache.stats()}")
+
 
 if __name__ == "__main__":
     run()
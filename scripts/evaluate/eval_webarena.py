@@ -3,19 +3,52 @@ import os
 os.environ["DSP_CACHEDIR"] = "local_cache"
 os.environ["OPENAI_API_KEY"] = os.getenv("OPENAPI_PERSONAL", "")
 
+import argparse
+import asyncio
 import glob
 import json
 import re
-import pandas as pd
+import socket
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from lib.agents.macro_cache import get_macro_cache
+from lib.agents.search_agent import SearchAgent
 from lib.agents.step_agent import StepAgent
 from lib.environments.webarena import WebArenaEnvironmentWrapper
+from lib.environments.browser_pool import BrowserPool
+from lib.environments.async_webarena import (
+    AsyncBrowserPool,
+    AsyncWebArenaEnvironmentWrapper,
+)
+from lib.modules.action_parser import repair_stats
+from lib.modules.lm_registry import batching_stats, get_batching_lm
+from lib.utils.checkpoint import Checkpointer, resume, use_checkpointer
+from lib.utils.results_store import ResultsStore
+from lib.utils.recording import TrajectoryRecorder, use_recorder
+from lib.utils.tracing import Tracer, use_tracer
+from lib.utils.trajectory_log import BlobStore, TrajectoryWriter, use_trajectory_writer
+from lib.utils.usage import env_budget, get_run_usage, use_usage
+from lib.utils.work_queue import WorkQueue, default_worker_id
+
+# One warm browser pool per process, so tasks handled by the same worker
+# reuse the Chromium instance instead of relaunching it.
+_browser_pool = None
+
+
+def get_browser_pool(max_tasks_per_browser=20, max_memory_mb=None):
+    global _browser_pool
+    if _browser_pool is None:
+        _browser_pool = BrowserPool(
+            max_tasks_per_browser=max_tasks_per_browser, max_memory_mb=max_memory_mb
+        )
+    return _browser_pool
 
 
 def log_run(
     log_file, log_data, summary_file=None, summary_data=None, json_indent=4, verbose=1
 ):
     """
-    Logs demo data to a JSON file and optionally updates a summary CSV file.
+    Logs demo data to a JSON file and optionally appends a row to the summary store.
     """
     # Write log data to JSON file
     with open(log_file, "w") as json_file:
@@ -23,80 +56,658 @@ def log_run(
     if verbose:
         print(f"Saved log to {log_file}")
 
-    # If summary data and file path are provided, update the summary
+    # If summary data and file path are provided, append to the summary
     if summary_data and summary_file:
-        if os.path.exists(summary_file):
-            df_summary = pd.read_csv(summary_file)
-        else:
-            df_summary = pd.DataFrame()
-        df_summary = pd.concat(
-            [df_summary, pd.DataFrame([summary_data])], ignore_index=True
-        )
-        df_summary.to_csv(summary_file, index=False)
+        ResultsStore(summary_file).append(summary_data)
         if verbose:
-            print(f"Updated summary: {df_summary}")
+            print(f"Updated summary: {summary_data}")
+
+        return summary_data
+
 
-        return df_summary
+def pending_config_files(config_file_list, dstdir):
+    """
+    Drops the configs whose task already has a log file in dstdir.
+    """
+    pending = []
+    for config_file in config_file_list:
+        with open(config_file, "r") as f:
+            task_config = json.load(f)
+        log_file = os.path.join(dstdir, f"{task_config['task_id']}.json")
+        if os.path.exists(log_file):
+            print(f"Skipping {config_file}, found {log_file}")
+            continue
+        pending.append(config_file)
+    return pending
 
 
-def run():
-    config_file_list = glob.glob("config_data/*.json")
+def task_recorder(config_file, dstdir):
+    with open(config_file, "r") as f:
+        task_config = json.load(f)
+    recording_dir = os.path.join(dstdir, "recordings")
+    os.makedirs(recording_dir, exist_ok=True)
+    return TrajectoryRecorder(
+        os.path.join(recording_dir, f"{task_config['task_id']}.jsonl.gz")
+    )
 
-    dstdir = "output_data"
 
-    agent_init = lambda: StepAgent(
+def task_trajectory_writer(config_file, dstdir, append=False):
+    with open(config_file, "r") as f:
+        task_config = json.load(f)
+    # Observations are deduplicated across all tasks written to dstdir
+    return TrajectoryWriter(
+        os.path.join(dstdir, "trajectories", f"{task_config['task_id']}.jsonl"),
+        BlobStore(os.path.join(dstdir, "blobs")),
+        append=append,
+    )
+
+
+def task_checkpointer(config_file, dstdir):
+    with open(config_file, "r") as f:
+        task_config = json.load(f)
+    return Checkpointer(
+        os.path.join(dstdir, "checkpoints", f"{task_config['task_id']}.pkl")
+    )
+
+
+def make_agent(agent_type):
+    if agent_type == "search_agent":
+        return SearchAgent(max_actions=50, verbose=True, logging=True, debug=False)
+    return StepAgent(
         max_actions=50,
         verbose=True,
         logging=True,
         debug=False,
     )
 
-    #####
-    # Evaluate
-    #####
 
-    for config_file in config_file_list:
-        env = WebArenaEnvironmentWrapper(
-            config_file=config_file,
-            max_steps=50,
-            slow_mo=0,
-            observation_type="accessibility_tree",
-            current_viewport_only=False,
-            viewport_size={"width": 1920, "height": 1080},
-            headless=True,
+def share_run_usage(dstdir, queue=None):
+    """
+    With a run budget, makes every worker process count its LM usage in one
+    SharedUsage database, read through LM_RUN_USAGE_PATH. A run starts from
+    zero, while the usage of a queue is kept next to it and carries over to
+    the nodes that join it or restart.
+    """
+    budget = env_budget("LM_RUN")
+    if budget["max_tokens"] is None and budget["max_cost"] is None:
+        return
+    if queue is not None:
+        path = f"{os.path.splitext(queue)[0]}-usage.db"
+    else:
+        path = os.path.join(dstdir, "run_usage.db")
+        if os.path.exists(path):
+            os.remove(path)
+    os.environ["LM_RUN_USAGE_PATH"] = path
+
+
+def run_budget_spent(config_file):
+    """
+    Checks the run budget before a task starts. A skipped task gets no result
+    row, so a later run picks it up again.
+    """
+    reason = get_run_usage().over_budget()
+    if reason is not None:
+        print(f"{reason}, skipping {config_file}")
+    return reason is not None
+
+
+def run_task(
+    config_file,
+    dstdir,
+    use_browser_pool=True,
+    trace=False,
+    record=False,
+    agent_type="step_agent",
+    checkpoint=False,
+):
+    """
+    Runs a single task in its own environment and agent.
+    Returns the log file path, the log data and the summary row, or None when
+    the run budget is spent.
+    With checkpoint=True the task is checkpointed after every step and resumed
+    from its last checkpoint, if a previous run of it did not finish.
+    """
+    if run_budget_spent(config_file):
+        return None
+    tracer = Tracer() if trace else None
+    recorder = task_recorder(config_file, dstdir) if record else None
+    # Only StepAgent tasks can be checkpointed
+    checkpointer = (
+        task_checkpointer(config_file, dstdir)
+        if checkpoint and agent_type == "step_agent"
+        else None
+    )
+    state = checkpointer.load() if checkpointer is not None else None
+    writer = task_trajectory_writer(config_file, dstdir, append=state is not None)
+    with (
+        use_tracer(tracer),
+        use_recorder(recorder),
+        use_trajectory_writer(writer),
+        use_usage(get_run_usage()),
+        use_checkpointer(checkpointer),
+    ):
+        try:
+            results = _run_task(
+                config_file, dstdir, use_browser_pool, tracer, agent_type, state
+            )
+        finally:
+            writer.close()
+            if recorder is not None:
+                recorder.close()
+    if checkpointer is not None:
+        checkpointer.clear()
+    return results
+
+
+def _run_task(config_file, dstdir, use_browser_pool, tracer, agent_type, state=None):
+    env = WebArenaEnvironmentWrapper(
+        config_file=config_file,
+        max_steps=50,
+        slow_mo=0,
+        observation_type="accessibility_tree",
+        current_viewport_only=False,
+        viewport_size={"width": 1920, "height": 1080},
+        headless=True,
+        adaptive_settle=True,
+        browser_pool=get_browser_pool() if use_browser_pool else None,
+    )
+
+    agent = make_agent(agent_type)
+    if state is not None:
+        resume(agent, env, state)
+        print(f"Resumed {config_file} at step {state['step']}")
+    objective = env.get_objective()
+    status = agent.act(objective=objective, env=env)
+    env.close()
+    if state is not None:
+        status["resumed_from_step"] = state["step"]
+    return task_results(config_file, dstdir, agent, status, tracer, agent_type)
+
+
+async def run_task_async(
+    config_file, dstdir, trace=False, record=False, lm=None, browser_pool=None
+):
+    """
+    Async counterpart of run_task, browser and LM work are awaited so that
+    many tasks can share one event loop.
+    """
+    if run_budget_spent(config_file):
+        return None
+    tracer = Tracer() if trace else None
+    recorder = task_recorder(config_file, dstdir) if record else None
+    writer = task_trajectory_writer(config_file, dstdir)
+    with (
+        use_tracer(tracer),
+        use_recorder(recorder),
+        use_trajectory_writer(writer),
+        use_usage(get_run_usage()),
+    ):
+        try:
+            return await _run_task_async(config_file, dstdir, tracer, lm, browser_pool)
+        finally:
+            writer.close()
+            if recorder is not None:
+                recorder.close()
+
+
+async def _run_task_async(config_file, dstdir, tracer, lm=None, browser_pool=None):
+    env = await AsyncWebArenaEnvironmentWrapper.create(
+        browser_pool=browser_pool,
+        config_file=config_file,
+        max_steps=50,
+        slow_mo=0,
+        observation_type="accessibility_tree",
+        current_viewport_only=False,
+        viewport_size={"width": 1920, "height": 1080},
+        headless=True,
+        adaptive_settle=True,
+    )
+
+    agent = StepAgent(
+        max_actions=50,
+        verbose=True,
+        logging=True,
+        debug=False,
+        lm=lm,
+    )
+    objective = env.get_objective()
+    try:
+        status = await agent.aact(objective=objective, env=env)
+    finally:
+        # Hands the browser thread back to the pool
+        await env.aclose()
+    return task_results(config_file, dstdir, agent, status, tracer)
+
+
+def task_results(
+    config_file, dstdir, agent, status, tracer=None, agent_type="step_agent"
+):
+    with open(config_file, "r") as f:
+        task_config = json.load(f)
+    log_file = os.path.join(dstdir, f"{task_config['task_id']}.json")
+    log_data = {
+        "task": config_file,
+        "id": task_config["task_id"],
+        "model": "gpt_4o",
+        "type": agent_type,
+    }
+    writer = agent.trajectory_writer
+    if writer is not None and writer.path:
+        # Streamed during the task, rebuild with scripts.evaluate.view_trajectory
+        log_data["trajectory_file"] = writer.path
+        log_data["blob_dir"] = writer.blob_store.root
+    else:
+        log_data["trajectory"] = agent.get_trajectory()
+    summary_data = {
+        "task": config_file,
+        "task_id": task_config["task_id"],
+        "model": "gpt_4o",
+        "type": agent_type,
+        "logfile": log_file,
+    }
+    summary_data.update(status)
+    if tracer is not None:
+        trace_file = os.path.join(dstdir, "traces", f"{task_config['task_id']}.json")
+        tracer.export_chrome_trace(trace_file)
+        summary_data["tracefile"] = trace_file
+        summary_data.update(tracer.phase_percentiles())
+    return log_file, log_data, summary_data
+
+
+async def run_async(
+    config_file_list,
+    dstdir,
+    summary_file,
+    async_tasks,
+    trace=False,
+    record=False,
+    batch_config=None,
+    max_tasks_per_browser=20,
+    max_memory_mb=None,
+):
+    browser_pool = AsyncBrowserPool(max_tasks_per_browser, max_memory_mb)
+    # Agents of concurrent tasks share one batching LM, their LM requests are
+    # grouped into batched requests instead of being sent one by one.
+    lm = get_batching_lm(**batch_config) if batch_config is not None else None
+    semaphore = asyncio.Semaphore(async_tasks)
+    loop = asyncio.get_running_loop()
+    # LM calls are dispatched to the default executor, size it to the number of
+    # tasks in flight so they are not serialised behind each other.
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=async_tasks))
+
+    async def bounded(config_file):
+        async with semaphore:
+            return await run_task_async(
+                config_file,
+                dstdir,
+                trace=trace,
+                record=record,
+                lm=lm,
+                browser_pool=browser_pool,
+            )
+
+    tasks = [bounded(config_file) for config_file in config_file_list]
+    for future in asyncio.as_completed(tasks):
+        try:
+            results = await future
+        except Exception as e:
+            print(f"Task failed: {e}")
+            continue
+        if results is None:
+            continue
+        log_file, log_data, summary_data = results
+        log_run(
+            log_file=log_file,
+            log_data=log_data,
+            summary_file=summary_file,
+            summary_data=summary_data,
         )
+    print(f"Browser pool: {browser_pool.stats()}")
+    browser_pool.close()
+    if batch_config is not None:
+        print(f"LM batching: {batching_stats()}")
 
-        agent = agent_init()
-        objective = env.get_objective()
-        status = agent.act(objective=objective, env=env)
-        env.close()
 
-        with open(config_file, "r") as f:
-            task_config = json.load(f)
-        log_file = os.path.join(dstdir, f"{task_config['task_id']}.json")
-        log_data = {
-            "task": config_file,
-            "id": task_config["task_id"],
-            "model": "gpt_4o",
-            "type": "step_agent",
-            "trajectory": agent.get_trajectory(),
-        }
-        summary_file = os.path.join(dstdir, "summary.csv")
-        summary_data = {
-            "task": config_file,
-            "task_id": task_config["task_id"],
-            "model": "gpt_4o",
-            "type": "step_agent",
-            "logfile": log_file,
-        }
-        summary_data.update(status)
+def queue_worker(
+    queue_path,
+    dstdir,
+    summary_file,
+    worker_id=None,
+    trace=False,
+    record=False,
+    agent_type="step_agent",
+    max_tasks_per_browser=20,
+    max_memory_mb=None,
+    checkpoint=False,
+):
+    """
+    Leases tasks from the shared queue until it is empty. The lease is kept
+    alive while a task runs, a task that raises goes back to the queue for
+    another attempt.
+    """
+    queue = WorkQueue(queue_path)
+    worker_id = worker_id or default_worker_id()
+    get_browser_pool(max_tasks_per_browser, max_memory_mb)
+    completed = 0
+    while get_run_usage().over_budget() is None:
+        config_file = queue.acquire(worker_id)
+        if config_file is None:
+            break
+        with queue.lease(config_file, worker_id):
+            try:
+                results = run_task(
+                    config_file,
+                    dstdir,
+                    trace=trace,
+                    record=record,
+                    agent_type=agent_type,
+                    checkpoint=checkpoint,
+                )
+            except Exception as e:
+                print(f"Task {config_file} failed: {e}")
+                queue.fail(config_file, worker_id, repr(e))
+                continue
+        if results is None:
+            # Not run, so the task keeps its attempt
+            queue.release(config_file, worker_id)
+            break
+        log_file, log_data, summary_data = results
+        summary_data.update(worker=worker_id, finished_at=time.time())
         log_run(
             log_file=log_file,
             log_data=log_data,
             summary_file=summary_file,
             summary_data=summary_data,
         )
+        if not queue.complete(config_file, worker_id):
+            print(f"Lease on {config_file} expired, it may be run again")
+        completed += 1
+    print(f"Worker {worker_id} completed {completed} tasks, queue: {queue.stats()}")
+    return completed
+
+
+def run_queue(
+    queue_path,
+    config_file_list,
+    dstdir,
+    workers=1,
+    node=None,
+    trace=False,
+    record=False,
+    agent_type="step_agent",
+    max_tasks_per_browser=20,
+    max_memory_mb=None,
+    checkpoint=False,
+):
+    """
+    Runs as one node of a multi-node evaluation: every node enqueues the same
+    configs (enqueueing is idempotent) and its workers pull tasks from the
+    shared queue. Each node appends to its own summary file, combine them with
+    `python -m scripts.evaluate.merge_results`.
+    """
+    queue = WorkQueue(queue_path)
+    added = queue.enqueue(config_file_list)
+    print(f"Enqueued {added} tasks, queue: {queue.stats()}")
+    node = node or socket.gethostname()
+    summary_file = os.path.join(dstdir, f"summary-{node}.jsonl")
+    worker_kwargs = dict(
+        trace=trace,
+        record=record,
+        agent_type=agent_type,
+        max_tasks_per_browser=max_tasks_per_browser,
+        max_memory_mb=max_memory_mb,
+        checkpoint=checkpoint,
+    )
+    if workers <= 1:
+        queue_worker(queue_path, dstdir, summary_file, **worker_kwargs)
+        get_browser_pool().close()
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(
+                    queue_worker, queue_path, dstdir, summary_file, **worker_kwargs
+                )
+                for _ in range(workers)
+            ]
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    print(f"Queue worker failed: {e}")
+    for config_file, attempts, error in queue.failed():
+        print(f"Failed after {attempts} attempts: {config_file}: {error}")
+
+
+def run(
+    workers=1,
+    async_tasks=0,
+    config_glob="config_data/*.json",
+    dstdir="output_data",
+    max_tasks_per_browser=20,
+    max_memory_mb=None,
+    trace=False,
+    record=False,
+    agent_type="step_agent",
+    batch_config=None,
+    queue=None,
+    node=None,
+    checkpoint=False,
+):
+    if batch_config is not None and (async_tasks <= 0 or queue is not None):
+        raise ValueError("batch_config requires async_tasks and no queue")
+    os.makedirs(dstdir, exist_ok=True)
+    share_run_usage(dstdir, queue)
+    config_file_list = pending_config_files(sorted(glob.glob(config_glob)), dstdir)
+    # Append-only, export with `python -m scripts.evaluate.export_results`
+    summary_file = os.path.join(dstdir, "summary.jsonl")
+
+    #####
+    # Evaluate
+    #####
+
+    if queue is not None:
+        run_queue(
+            queue,
+            config_file_list,
+            dstdir,
+            workers=workers,
+            node=node,
+            trace=trace,
+            record=record,
+            agent_type=agent_type,
+            checkpoint=checkpoint,
+            max_tasks_per_browser=max_tasks_per_browser,
+            max_memory_mb=max_memory_mb,
+        )
+        return
+
+    if async_tasks > 0:
+        if agent_type != "step_agent":
+            raise ValueError(f"{agent_type} is not supported with async_tasks")
+        if checkpoint:
+            raise ValueError("checkpoint is not supported with async_tasks")
+        asyncio.run(
+            run_async(
+                config_file_list,
+                dstdir,
+                summary_file,
+                async_tasks,
+                trace,
+                record,
+                batch_config,
+                max_tasks_per_browser,
+                max_memory_mb,
+            )
+        )
+        return
+
+    if workers <= 1:
+        browser_pool = get_browser_pool(max_tasks_per_browser, max_memory_mb)
+        for config_file in config_file_list:
+            results = run_task(
+                config_file,
+                dstdir,
+                trace=trace,
+                record=record,
+                agent_type=agent_type,
+                checkpoint=checkpoint,
+            )
+            if results is None:
+                continue
+            log_file, log_data, summary_data = results
+            log_run(
+                log_file=log_file,
+                log_data=log_data,
+                summary_file=summary_file,
+                summary_data=summary_data,
+            )
+        print(f"Browser pool: {browser_pool.stats()}")
+        print(f"Action repair: {repair_stats.snapshot()}")
+        print(f"LM usage: {get_run_usage().summary()}")
+        if get_macro_cache() is not None:
+            print(f"Macro cache: {get_macro_cache().stats()}")
+        browser_pool.close()
+        return
+
+    # Each worker process builds its own browser and agent per task, results are
+    # collected and written from the parent as tasks complete.
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=get_browser_pool,
+        initargs=(max_tasks_per_browser, max_memory_mb),
+    ) as executor:
+        futures = {
+            executor.submit(
+                run_task,
+                config_file,
+                dstdir,
+                trace=trace,
+                record=record,
+                agent_type=agent_type,
+                checkpoint=checkpoint,
+            ): config_file
+            for config_file in config_file_list
+        }
+        for future in as_completed(futures):
+            try:
+                results = future.result()
+            except Exception as e:
+                print(f"Task {futures[future]} failed: {e}")
+                continue
+            # Skipped by a worker whose run budget is spent
+            if results is None:
+                continue
+            log_file, log_data, summary_data = results
+            log_run(
+                log_file=log_file,
+                log_data=log_data,
+                summary_file=summary_file,
+                summary_data=summary_data,
+            )
 
 
 if __name__ == "__main__":
-    run()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--async_tasks", type=int, default=0)
+    parser.add_argument(
+        "--agent",
+        type=str,
+        default="step_agent",
+        choices=["step_agent", "search_agent"],
+        help="search_agent is not supported with --async_tasks",
+    )
+    parser.add_argument("--config_glob", type=str, default="config_data/*.json")
+    parser.add_argument("--dstdir", type=str, default="output_data")
+    parser.add_argument("--max_tasks_per_browser", type=int, default=20)
+    parser.add_argument("--max_memory_mb", type=float, default=None)
+    parser.add_argument("--trace", action="store_true")
+    parser.add_argument(
+        "--record",
+        action="store_true",
+        help="Record trajectories for scripts.evaluate.replay_webarena",
+    )
+    parser.add_argument(
+        "--batch_lm",
+        action="store_true",
+        help="Batch LM requests across tasks, requires --async_tasks, not "
+        "supported with --queue",
+    )
+    parser.add_argument("--batch_max_wait_ms", type=float, default=20)
+    parser.add_argument("--batch_max_size", type=int, default=16)
+    parser.add_argument(
+        "--batch_url",
+        type=str,
+        default=None,
+        help="Base URL of an OpenAI compatible server, e.g. vLLM at "
+        "http://localhost:8000/v1, a batch is sent as one completions request "
+        "with a list of prompts. The requests of a batch are sent "
+        "concurrently otherwise",
+    )
+    parser.add_argument("--max_task_tokens", type=int, default=None)
+    parser.add_argument("--max_task_cost", type=float, default=None, help="USD")
+    parser.add_argument(
+        "--max_run_tokens",
+        type=int,
+        default=None,
+        help="Shared by all workers, and with --queue by all nodes of the queue",
+    )
+    parser.add_argument(
+        "--max_run_cost",
+        type=float,
+        default=None,
+        help="USD, shared like --max_run_tokens",
+    )
+    parser.add_argument(
+        "--queue",
+        type=str,
+        default=None,
+        help="Shared SQLite work queue, for running one node of a multi-node run",
+    )
+    parser.add_argument(
+        "--node", type=str, default=None, help="Node name, the hostname by default"
+    )
+    parser.add_argument(
+        "--checkpoint",
+        action="store_true",
+        help="Checkpoint tasks after every step and resume unfinished tasks "
+        "from their last checkpoint, step_agent only, not supported with "
+        "--async_tasks",
+    )
+    args = parser.parse_args()
+    # Budgets are read by the agents and worker processes from the environment
+    for name, value in [
+        ("LM_TASK_MAX_TOKENS", args.max_task_tokens),
+        ("LM_TASK_MAX_COST", args.max_task_cost),
+        ("LM_RUN_MAX_TOKENS", args.max_run_tokens),
+        ("LM_RUN_MAX_COST", args.max_run_cost),
+    ]:
+        if value is not None:
+            os.environ[name] = str(value)
+    if args.record:
+        # Every LM request has to reach the LM to be recorded
+        os.environ["LLM_CACHE_PATH"] = ""
+        os.environ["MACRO_CACHE_PATH"] = ""
+    run(
+        workers=args.workers,
+        async_tasks=args.async_tasks,
+        config_glob=args.config_glob,
+        dstdir=args.dstdir,
+        max_tasks_per_browser=args.max_tasks_per_browser,
+        max_memory_mb=args.max_memory_mb,
+        trace=args.trace,
+        record=args.record,
+        agent_type=args.agent,
+        batch_config=(
+            dict(
+                max_wait_ms=args.batch_max_wait_ms,
+                max_batch_size=args.batch_max_size,
+                batch_url=args.batch_url,
+            )
+            if args.batch_lm
+            else None
+        ),
+        queue=args.queue,
+        node=args.node,
+        checkpoint=args.checkpoint,
+    )
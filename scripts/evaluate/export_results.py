@@ -0,0 +1,25 @@
+import argparse
+import os
+
+from lib.utils.results_store import ResultsStore
+
+
+def run(dstdir="output_data", output_file=None):
+    store = ResultsStore(os.path.join(dstdir, "summary.jsonl"))
+    output_file = output_file or os.path.join(dstdir, "summary.csv")
+    df_summary = store.compact(output_file)
+    print(f"Exported {len(df_summary)} tasks to {output_file}")
+    return df_summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dstdir", type=str, default="output_data")
+    parser.add_argument(
+        "--output_file",
+        type=str,
+        default=None,
+        help="summary.csv by default, use a .parquet extension for Parquet",
+    )
+    args = parser.parse_args()
+    run(dstdir=args.dstdir, output_file=args.output_file)
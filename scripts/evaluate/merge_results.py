@@ -0,0 +1,65 @@
+import argparse
+import glob
+import os
+
+from lib.utils.results_store import ResultsStore
+from lib.utils.work_queue import WorkQueue
+
+
+def merge_rows(summary_files):
+    """
+    Keeps one row per task_id across the node summaries, the one finished
+    last when a task was run more than once (e.g. after its lease expired).
+    """
+    rows = {}
+    for summary_file in summary_files:
+        for row in ResultsStore(summary_file).read():
+            key = row.get("task_id", row.get("task"))
+            previous = rows.get(key)
+            if previous is None or row.get("finished_at", 0) >= previous.get(
+                "finished_at", 0
+            ):
+                rows[key] = row
+    return sorted(rows.values(), key=lambda row: str(row.get("task_id")))
+
+
+def run(dstdirs=("output_data",), output_dir=None, queue=None):
+    summary_files = []
+    for dstdir in dstdirs:
+        summary_files.extend(sorted(glob.glob(os.path.join(dstdir, "summary-*.jsonl"))))
+    output_dir = output_dir or dstdirs[0]
+    output_file = os.path.join(output_dir, "summary.jsonl")
+    rows = merge_rows(summary_files)
+    # Rewritten from scratch so merging twice does not duplicate rows
+    if os.path.exists(output_file):
+        os.remove(output_file)
+    store = ResultsStore(output_file)
+    for row in rows:
+        store.append(row)
+    print(f"Merged {len(rows)} tasks from {len(summary_files)} files to {output_file}")
+    if queue is not None:
+        work_queue = WorkQueue(queue)
+        print(f"Queue: {work_queue.stats()}")
+        for config_file, attempts, error in work_queue.failed():
+            print(f"Failed after {attempts} attempts: {config_file}: {error}")
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--dstdirs",
+        type=str,
+        nargs="+",
+        default=["output_data"],
+        help="Output directories holding the summary-<node>.jsonl files",
+    )
+    parser.add_argument(
+        "--output_dir",
+        type=str,
+        default=None,
+        help="Where summary.jsonl is written, the first dstdir by default",
+    )
+    parser.add_argument("--queue", type=str, default=None)
+    args = parser.parse_args()
+    run(dstdirs=args.dstdirs, output_dir=args.output_dir, queue=args.queue)
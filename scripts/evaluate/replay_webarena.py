@@ -0,0 +1,92 @@
+import os
+
+# Replays must reach the recorded LM responses, not the response cache
+os.environ["LLM_CACHE_PATH"] = ""
+os.environ["MACRO_CACHE_PATH"] = ""
+
+import argparse
+import glob
+import json
+import time
+
+from lib.agents.step_agent import StepAgent
+from lib.environments.replay import ReplayEnvironment, ReplayLM
+from lib.utils.recording import TrajectoryRecorder, load_recording, use_recorder
+
+
+def stack_transitions(events):
+    return [
+        (event["op"], event["objective"]) for event in events if event["type"] == "stack"
+    ]
+
+
+def replay_task(recording_file):
+    """
+    Re-runs StepAgent against a recorded task without a browser or an LM and
+    compares the actions, LM prompts and stack transitions with the recording.
+    """
+    events = load_recording(recording_file)
+    env = ReplayEnvironment(events)
+    lm = ReplayLM(events)
+    agent = StepAgent(max_actions=50, verbose=False, logging=False, debug=False, lm=lm)
+
+    recorder = TrajectoryRecorder()
+    start = time.perf_counter()
+    with use_recorder(recorder):
+        status = agent.act(objective=env.get_objective(), env=env)
+    wall_time = time.perf_counter() - start
+
+    return {
+        "recording": recording_file,
+        "steps": env.steps,
+        "wall_time": wall_time,
+        "lm_calls": lm.calls,
+        "prompt_mismatches": lm.prompt_mismatches,
+        "action_mismatches": env.action_mismatches,
+        "stack_matches": stack_transitions(events)
+        == stack_transitions(recorder.events),
+        "reward": status.get("reward"),
+    }
+
+
+def run(recording_glob="output_data/recordings/*.jsonl.gz", output_file=None):
+    results = []
+    start = time.perf_counter()
+    for recording_file in sorted(glob.glob(recording_glob)):
+        try:
+            results.append(replay_task(recording_file))
+        except Exception as e:
+            print(f"Replay of {recording_file} failed: {e}")
+            results.append({"recording": recording_file, "error": str(e)})
+    wall_time = time.perf_counter() - start
+
+    steps = sum(result.get("steps", 0) for result in results)
+    summary = {
+        "tasks": len(results),
+        "steps": steps,
+        "wall_time": wall_time,
+        "steps_per_sec": steps / wall_time if wall_time else 0.0,
+        "diverged_tasks": sum(
+            1
+            for result in results
+            if "error" in result
+            or result["prompt_mismatches"]
+            or result["action_mismatches"]
+            or not result["stack_matches"]
+        ),
+    }
+    print(json.dumps(summary, indent=4))
+    if output_file:
+        with open(output_file, "w") as f:
+            json.dump({"summary": summary, "tasks": results}, f, indent=4)
+    return summary, results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--recording_glob", type=str, default="output_data/recordings/*.jsonl.gz"
+    )
+    parser.add_argument("--output_file", type=str, default=None)
+    args = parser.parse_args()
+    run(recording_glob=args.recording_glob, output_file=args.output_file)
@@ -0,0 +1,32 @@
+import argparse
+import json
+
+from lib.utils.trajectory_log import BlobStore, read_trajectory
+
+
+def run(log_file, output_file=None):
+    """
+    Rebuilds the full per step JSON view of a task from its log file, the
+    streamed trajectory and the observation blob store.
+    """
+    with open(log_file, "r") as f:
+        log_data = json.load(f)
+    if "trajectory_file" in log_data:
+        log_data["trajectory"] = read_trajectory(
+            log_data.pop("trajectory_file"), BlobStore(log_data.pop("blob_dir"))
+        )
+    if output_file:
+        with open(output_file, "w") as f:
+            json.dump(log_data, f, indent=4)
+        print(f"Saved {len(log_data['trajectory'])} steps to {output_file}")
+    else:
+        print(json.dumps(log_data, indent=4))
+    return log_data
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("log_file", type=str, help="e.g. output_data/<task_id>.json")
+    parser.add_argument("--output_file", type=str, default=None)
+    args = parser.parse_args()
+    run(log_file=args.log_file, output_file=args.output_file)
@@ -0,0 +1,43 @@
+import pytest
+
+from lib.modules.action_parser import ParsedAction, action_grammar
+
+
+@pytest.mark.parametrize(
+    "raw, expected",
+    [
+        ("click [12]", "click [12]"),
+        ("type [3] [hello world] [1]", "type [3] [hello world] [1]"),
+        ("type [3] [hello]", "type [3] [hello]"),
+        ("```\nclick [12]\n```", "click [12]"),
+        ("Action: click ['12']", "click [12]"),
+        ("I should not stop yet, click [3]", "click [3]"),
+        ("stop [42] since the answer is 42", "stop [42]"),
+        ("stop [N/A]", "stop [N/A]"),
+        ("find_directions [CMU to Pitt]", "find_directions [CMU to Pitt]"),
+    ],
+)
+def test_repair(raw, expected):
+    assert action_grammar().repair(raw) == expected
+
+
+@pytest.mark.parametrize("raw", ["stop []", "stop", "stop.", "```\nstop\n```"])
+def test_empty_stop(raw):
+    action = action_grammar().parse(raw)
+    assert action == ParsedAction("stop", ("",))
+    assert action.is_stop
+    assert action.answer == ""
+
+
+@pytest.mark.parametrize(
+    "raw", ["", "click []", "click", "I am not sure what to do", "map_planner [x]"]
+)
+def test_invalid(raw):
+    assert action_grammar().parse(raw) is None
+
+
+def test_element_id():
+    action = action_grammar().parse("type [7] [Zoe] [0]")
+    assert action.element_id == "7"
+    assert not action.is_module
+    assert action_grammar().parse("find_directions [a to b]").is_module
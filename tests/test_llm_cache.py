@@ -0,0 +1,55 @@
+import pytest
+
+import lib.utils.llm_cache as llm_cache
+from lib.utils.llm_cache import LLMCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        # Every access is later than the previous one
+        self.now += 1
+        return self.now
+
+
+@pytest.fixture(autouse=True)
+def clock(monkeypatch):
+    monkeypatch.setattr(llm_cache.time, "time", Clock().time)
+
+
+def test_get_and_put(tmp_path):
+    cache = LLMCache(path=str(tmp_path / "cache.sqlite"))
+    assert cache.get("a") is None
+    cache.put("a", {"action": "click [1]"})
+    assert cache.get("a") == {"action": "click [1]"}
+    # Shared with other processes through the database
+    assert LLMCache(path=cache.path).get("a") == {"action": "click [1]"}
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+    assert (stats["total_hits"], stats["total_misses"]) == (2, 1)
+
+
+def test_evicts_least_recently_used_entries(tmp_path):
+    cache = LLMCache(path=str(tmp_path / "cache.sqlite"), max_entries=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats()["entries"] == 2
+
+
+def test_evicts_by_size(tmp_path):
+    cache = LLMCache(path=str(tmp_path / "cache.sqlite"), max_bytes=25)
+    for key in "abc":
+        cache.put(key, "x" * 8)
+    assert cache.get("a") is None
+    assert cache.get("b") == "x" * 8
+    cache.put("d", "x" * 8)
+    assert cache.get("c") is None
+    assert cache.get("b") == "x" * 8
+    assert cache.stats()["bytes"] <= 25
@@ -0,0 +1,75 @@
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from lib.modules.lm_batching import BatchDispatcher, BatchingLM, CompletionsBackend
+
+
+class CompletionsHandler(BaseHTTPRequestHandler):
+    # Answers like an OpenAI compatible /v1/completions endpoint
+    requests = []
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.requests.append((self.path, body))
+        n = body.get("n", 1)
+        choices = [
+            {"index": i * n + j, "text": f"{prompt} -> {j}"}
+            for i, prompt in enumerate(body["prompt"])
+            for j in range(n)
+        ]
+        # Choices may come back in any order
+        data = json.dumps({"choices": choices[::-1]}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class LM:
+    def __init__(self, **kwargs):
+        self.kwargs = {"model": "test-model", "model_type": "text", **kwargs}
+
+
+@pytest.fixture
+def server():
+    CompletionsHandler.requests = []
+    server = HTTPServer(("127.0.0.1", 0), CompletionsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}/v1"
+    server.shutdown()
+
+
+def test_completions_backend(server):
+    backend = CompletionsBackend(server + "/")
+    kwargs = {"n": 2, "only_completed": True}
+    completions = backend(LM(temperature=0.5), ["a", "b"], kwargs)
+    assert completions == [["a -> 0", "a -> 1"], ["b -> 0", "b -> 1"]]
+    path, body = CompletionsHandler.requests[0]
+    assert path == "/v1/completions"
+    assert body == {
+        "model": "test-model",
+        "temperature": 0.5,
+        "n": 2,
+        "prompt": ["a", "b"],
+    }
+
+
+def test_concurrent_requests_are_one_batch(server):
+    dispatcher = BatchDispatcher(
+        backend=CompletionsBackend(server), max_wait_ms=200, max_batch_size=8
+    )
+    lm = BatchingLM(LM(), dispatcher)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lm, [f"prompt {i}" for i in range(8)]))
+    assert results == [[f"prompt {i} -> 0"] for i in range(8)]
+    assert len(CompletionsHandler.requests) == 1
+    assert len(CompletionsHandler.requests[0][1]["prompt"]) == 8
+    assert dispatcher.stats()["batches"] == 1
@@ -0,0 +1,67 @@
+import random
+import time
+
+from lib.environments.observation_pruning import ObservationPruner
+from lib.utils.tokens import estimate_tokens
+
+QUERY = "What is the total shipping price of the latest order by customer Zoe?"
+
+
+def page(num_nodes=5000, seed=0):
+    rnd = random.Random(seed)
+    roles = ["link", "button", "StaticText", "gridcell", "heading", "textbox"]
+    words = [f"word{i}" for i in range(3000)]
+    words[200:200] = ["order", "customer", "total", "shipping", "price", "status"]
+    weights = [1 / (i + 1) for i in range(len(words))]
+    lines = ["[1] RootWebArea 'Dashboard' focused: True"]
+    depth = 1
+    for node_id in range(2, num_nodes + 1):
+        depth = max(1, min(depth + rnd.choice([-1, 0, 0, 1]), 12))
+        name = " ".join(rnd.choices(words, weights, k=rnd.randint(1, 8)))
+        role = rnd.choice(roles)
+        lines.append("\t" * depth + f"[{node_id}] {role} '{name}'")
+    return "\n".join(lines)
+
+
+def test_keeps_relevant_nodes_and_ancestors():
+    text = "\n".join(
+        [
+            "[1] RootWebArea 'Orders'",
+            "\t[2] navigation ''",
+            *[f"\t\t[{i}] link 'Menu entry {i}'" for i in range(3, 200)],
+            "\t[200] main ''",
+            "\t\t[201] table ''",
+            "\t\t\t\t[202] gridcell 'Shipping price 5.00'",
+        ]
+    )
+    pruned = ObservationPruner(max_tokens=50).prune(text, "shipping price")
+    lines = pruned.split("\n")
+    assert "\t\t\t\t[202] gridcell 'Shipping price 5.00'" in lines
+    # Ancestors by indentation, also across a skipped level
+    assert "\t\t[201] table ''" in lines
+    assert "\t[200] main ''" in lines
+    assert lines[0] == "[1] RootWebArea 'Orders'"
+    assert estimate_tokens(pruned) < estimate_tokens(text)
+
+
+def test_respects_budget():
+    text = page(num_nodes=1000)
+    pruned = ObservationPruner(max_tokens=500).prune(text, QUERY)
+    assert sum(len(line) // 4 + 1 for line in pruned.split("\n")) <= 500
+
+
+def test_small_pages_are_unchanged():
+    text = page(num_nodes=10)
+    assert ObservationPruner(max_tokens=2000).prune(text, QUERY) == text
+
+
+def test_prunes_5k_node_tree_in_a_few_milliseconds():
+    text = page()
+    pruner = ObservationPruner(max_tokens=2000)
+    pruner.prune(text, QUERY)
+    timings = []
+    for _ in range(5):
+        start = time.perf_counter()
+        pruner.prune(text, QUERY)
+        timings.append(time.perf_counter() - start)
+    assert min(timings) < 0.010
@@ -0,0 +1,67 @@
+import multiprocessing
+
+import pytest
+
+from lib.utils.results_store import ResultsStore
+
+
+def append_rows(path, worker, times):
+    store = ResultsStore(path)
+    for i in range(times):
+        store.append({"task_id": f"{worker}-{i}", "text": "x" * 1000})
+
+
+def test_append_and_read(tmp_path):
+    store = ResultsStore(str(tmp_path / "summary.jsonl"))
+    assert store.read() == []
+    store.append({"task_id": 1, "success": 1.0})
+    store.append({"task_id": 2, "success": 0.0})
+    assert store.read() == [
+        {"task_id": 1, "success": 1.0},
+        {"task_id": 2, "success": 0.0},
+    ]
+
+
+def test_skips_torn_line(tmp_path):
+    path = tmp_path / "summary.jsonl"
+    store = ResultsStore(str(path))
+    store.append({"task_id": 1})
+    with open(path, "a") as f:
+        f.write('{"task_id": 2, "succ')
+    assert store.read() == [{"task_id": 1}]
+
+
+def test_processes_append_whole_rows(tmp_path):
+    path = str(tmp_path / "summary.jsonl")
+    processes = [
+        multiprocessing.Process(target=append_rows, args=(path, worker, 50))
+        for worker in range(4)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    rows = ResultsStore(path).read()
+    assert len(rows) == 200
+    assert len({row["task_id"] for row in rows}) == 200
+
+
+@pytest.mark.parametrize("extension", ["csv", "parquet"])
+def test_compact_keeps_last_row_per_task(tmp_path, extension):
+    pd = pytest.importorskip("pandas")
+    if extension == "parquet":
+        pytest.importorskip("pyarrow")
+    store = ResultsStore(str(tmp_path / "summary.jsonl"))
+    store.append({"task_id": 1, "success": 0.0})
+    store.append({"task_id": 2, "success": 1.0})
+    store.append({"task_id": 1, "success": 1.0})
+    output_file = str(tmp_path / f"summary.{extension}")
+    store.compact(output_file)
+    if extension == "parquet":
+        df_summary = pd.read_parquet(output_file)
+    else:
+        df_summary = pd.read_csv(output_file)
+    assert df_summary.to_dict("records") == [
+        {"task_id": 1, "success": 1.0},
+        {"task_id": 2, "success": 1.0},
+    ]
@@ -0,0 +1,79 @@
+import json
+
+import pytest
+
+from lib.environments.trajectory_store import SpilledState, TrajectoryStore
+
+
+def state(text):
+    return {"observation": {"text": text}, "info": {"page": text}}
+
+
+def test_materialize_loads_spilled_states():
+    store = TrajectoryStore(max_memory_mb=0)
+    store.append(state("first"))
+    store.append({"action_type": 1, "answer": ""})
+    store.append(state("second"))
+    assert any(isinstance(item, SpilledState) for item in store.items)
+    trajectory = store.materialize()
+    assert type(trajectory) is list
+    assert trajectory == [
+        state("first"),
+        {"action_type": 1, "answer": ""},
+        state("second"),
+    ]
+    store.close()
+
+
+def test_evaluation_trajectory_keeps_states_spilled():
+    store = TrajectoryStore(max_memory_mb=0)
+    store.append(state("first"))
+    store.append({"action_type": 1, "answer": ""})
+    store.append(state("second"))
+    store.append({"action_type": 17, "answer": "42"})
+    trajectory = store.evaluation_trajectory()
+    assert type(trajectory) is list
+    assert len(trajectory) == 4
+    assert trajectory[0] == {"observation": {}, "info": {"spilled": True}}
+    assert trajectory[-1] == {"action_type": 17, "answer": "42"}
+    assert all(not isinstance(item, SpilledState) for item in trajectory)
+    assert any(isinstance(item, SpilledState) for item in store.items)
+    store.close()
+
+
+def test_evaluator_accepts_spilled_store(tmp_path):
+    browser_env = pytest.importorskip("browser_env")
+    evaluators = pytest.importorskip("evaluation_harness.evaluators")
+
+    config_file = tmp_path / "config.json"
+    config_file.write_text(
+        json.dumps(
+            {
+                "task_id": 0,
+                "intent": "What is the answer?",
+                "start_url": "http://localhost",
+                "eval": {
+                    "eval_types": ["string_match"],
+                    "reference_answers": {"exact_match": "42"},
+                    "reference_url": "",
+                    "program_html": [],
+                },
+            }
+        )
+    )
+    store = TrajectoryStore(max_memory_mb=0)
+    store.append(state("first"))
+    store.append(browser_env.create_id_based_action("click [1]"))
+    store.append(state("second"))
+    store.append(browser_env.create_id_based_action("stop [42]"))
+    assert any(isinstance(item, SpilledState) for item in store.items)
+
+    evaluator = evaluators.evaluator_router(str(config_file)).evaluators[0]
+    score = evaluator(
+        trajectory=store.evaluation_trajectory(),
+        config_file=str(config_file),
+        page=None,
+        client=None,
+    )
+    assert score == 1.0
+    store.close()
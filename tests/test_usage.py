@@ -0,0 +1,40 @@
+import multiprocessing
+
+import pytest
+
+from lib.utils.usage import BudgetExceeded, SharedUsage, UsageMeter
+
+
+def add_usage(path, times):
+    meter = UsageMeter(name="run", shared=SharedUsage(path))
+    for _ in range(times):
+        meter.add("gpt-4o-mini", 10, 5, 0.1)
+
+
+def test_meters_share_the_budget(tmp_path):
+    path = str(tmp_path / "usage.db")
+    first = UsageMeter(name="run", max_tokens=100, shared=SharedUsage(path))
+    second = UsageMeter(name="run", max_tokens=100, shared=SharedUsage(path))
+    first.add("gpt-4o-mini", 40, 20, 1.0)
+    assert second.over_budget() is None
+    second.add("gpt-4o-mini", 30, 10, 1.0)
+    # Each meter used less than the budget, together they used it up
+    assert first.prompt_tokens + first.completion_tokens == 60
+    with pytest.raises(BudgetExceeded):
+        first.check()
+    assert second.over_budget() == "run token budget exceeded: 100 >= 100"
+
+
+def test_processes_add_atomically(tmp_path):
+    path = str(tmp_path / "usage.db")
+    SharedUsage(path)
+    processes = [
+        multiprocessing.Process(target=add_usage, args=(path, 50)) for _ in range(4)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    tokens, cost = SharedUsage(path).totals()
+    assert tokens == 4 * 50 * 15
+    assert cost == pytest.approx(4 * 50 * (10 * 0.15 + 5 * 0.60) / 1e6)
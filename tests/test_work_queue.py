@@ -0,0 +1,91 @@
+import json
+
+import pytest
+
+import lib.utils.work_queue as work_queue
+from lib.utils.work_queue import WorkQueue
+from scripts.evaluate.merge_results import merge_rows
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(work_queue.time, "time", clock.time)
+    return clock
+
+
+def test_tasks_are_leased_once(tmp_path):
+    queue = WorkQueue(str(tmp_path / "queue.db"))
+    assert queue.enqueue(["a.json", "b.json"]) == 2
+    assert queue.enqueue(["a.json"]) == 0
+    assert queue.acquire("w1") == "a.json"
+    assert queue.acquire("w2") == "b.json"
+    assert queue.acquire("w3") is None
+    assert queue.complete("a.json", "w1")
+    # Only the lease holder can complete a task
+    assert not queue.complete("b.json", "w1")
+    assert queue.stats() == {"pending": 0, "leased": 1, "done": 1, "failed": 0}
+
+
+def test_expired_lease_is_requeued(tmp_path, clock):
+    queue = WorkQueue(str(tmp_path / "queue.db"), lease_seconds=10)
+    queue.enqueue(["a.json"])
+    assert queue.acquire("w1") == "a.json"
+    clock.now += 5
+    assert queue.heartbeat("a.json", "w1")
+    clock.now += 9
+    assert queue.acquire("w2") is None
+    clock.now += 2
+    assert queue.acquire("w2") == "a.json"
+    # The crashed worker lost its lease
+    assert not queue.heartbeat("a.json", "w1")
+    assert not queue.complete("a.json", "w1")
+    assert queue.complete("a.json", "w2")
+
+
+def test_max_attempts(tmp_path, clock):
+    queue = WorkQueue(str(tmp_path / "queue.db"), lease_seconds=10, max_attempts=2)
+    queue.enqueue(["a.json"])
+    assert queue.acquire("w1") == "a.json"
+    clock.now += 11
+    assert queue.acquire("w2") == "a.json"
+    assert queue.fail("a.json", "w2", "boom")
+    assert queue.acquire("w3") is None
+    assert queue.stats()["failed"] == 1
+    assert queue.failed() == [("a.json", 2, "boom")]
+
+
+def test_release_keeps_the_attempt(tmp_path):
+    queue = WorkQueue(str(tmp_path / "queue.db"), max_attempts=1)
+    queue.enqueue(["a.json"])
+    assert queue.acquire("w1") == "a.json"
+    assert queue.release("a.json", "w1")
+    assert queue.acquire("w2") == "a.json"
+    assert queue.fail("a.json", "w2", "boom")
+    assert queue.failed() == [("a.json", 1, "boom")]
+
+
+def test_merge_rows_keeps_last_finished(tmp_path):
+    first, second = tmp_path / "summary-a.jsonl", tmp_path / "summary-b.jsonl"
+    first.write_text(
+        json.dumps({"task_id": 1, "success": 0, "finished_at": 20}) + "\n"
+        + json.dumps({"task_id": 2, "success": 1, "finished_at": 5}) + "\n"
+    )
+    second.write_text(
+        json.dumps({"task_id": 1, "success": 1, "finished_at": 10}) + "\n"
+        + json.dumps({"task_id": 3, "success": 1, "finished_at": 7}) + "\n"
+    )
+    rows = merge_rows([str(second), str(first)])
+    assert [(row["task_id"], row["success"]) for row in rows] == [
+        (1, 0),
+        (2, 1),
+        (3, 1),
+    ]